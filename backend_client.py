@@ -0,0 +1,65 @@
+import os
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import metrics
+
+"""
+HTTP client used by the front server to call post_api and vote_api
+
+Each backend gets one requests.Session with its own connection pool, so
+connections are kept alive and reused between requests instead of opening a
+new TCP connection for every backend call. Every call is timed in the
+backend_request_duration_seconds metric (backend "http", operation "<name> <path>").
+
+Configuration (environment variables):
+POST_API_URL            base url of post_api (default http://127.0.0.1:5100)
+VOTE_API_URL            base url of vote_api (default http://127.0.0.1:5200)
+BACKEND_POOL_SIZE       connections kept per backend (default 10)
+BACKEND_CONNECT_TIMEOUT seconds to wait for a connection (default 2)
+BACKEND_READ_TIMEOUT    seconds to wait for a response (default 10)
+"""
+
+POST_API_URL = os.environ.get('POST_API_URL', 'http://127.0.0.1:5100')
+VOTE_API_URL = os.environ.get('VOTE_API_URL', 'http://127.0.0.1:5200')
+POOL_SIZE = int(os.environ.get('BACKEND_POOL_SIZE', 10))
+CONNECT_TIMEOUT = float(os.environ.get('BACKEND_CONNECT_TIMEOUT', 2))
+READ_TIMEOUT = float(os.environ.get('BACKEND_READ_TIMEOUT', 10))
+
+
+class Backend:
+    """pooled keep-alive client for one backend service"""
+
+    def __init__(self, base_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, keep_alive=True, name=None):
+        self.base_url = base_url.rstrip('/')
+        self.name = name or urlsplit(self.base_url).netloc
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            # every request opens and closes its own connection (used to benchmark reuse)
+            self.session.headers['Connection'] = 'close'
+
+    def request(self, method, path, **kwargs):
+        with metrics.backend_timer('http', '{} {}'.format(self.name, path)):
+            return self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+
+    def get(self, path, params=None):
+        return self.request('GET', path, params=params)
+
+    def post(self, path, json=None):
+        return self.request('POST', path, json=json)
+
+    def delete(self, path, params=None):
+        return self.request('DELETE', path, params=params)
+
+    def close(self):
+        self.session.close()
+
+
+# shared clients, one per backend
+post_backend = Backend(POST_API_URL, name='post_api')
+vote_backend = Backend(VOTE_API_URL, name='vote_api')
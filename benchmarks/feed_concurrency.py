@@ -0,0 +1,72 @@
+"""
+Throughput and tail latency of a front server under concurrent feed requests
+
+Sends --requests feed requests with --concurrency requests in flight against a
+running front server and reports requests/s, p50 and p99. Compare the
+synchronous front server with the asynchronous one:
+python benchmarks/feed_concurrency.py --url http://localhost:5000 --concurrency 50
+python benchmarks/feed_concurrency.py --url http://localhost:5001 --concurrency 50
+
+The same few feeds are requested over and over, so with the feed cache on they are
+cache hits and the backends are hardly called: start the front servers with
+FEED_CACHE_TTL=0 to compare the sync and async backend calls, and report runs with
+the cache on separately.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+
+
+async def worker(session, urls, timings, errors):
+    for url in urls:
+        start = time.perf_counter()
+        try:
+            async with session.get(url) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors.append(resp.status)
+        except aiohttp.ClientError as e:
+            errors.append(repr(e))
+        timings.append(time.perf_counter() - start)
+
+
+async def run(base_url, paths, requests_, concurrency):
+    # one shared iterator, so the workers split the requests between them
+    urls = (base_url + path for path in itertools.islice(itertools.cycle(paths), requests_))
+    timings = []
+    errors = []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(session, urls, timings, errors) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return timings, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--n', type=int, default=25)
+    parser.add_argument('--community-name', default='csuf')
+    args = parser.parse_args()
+
+    paths = [
+        f'/get?n={args.n}&community_name={args.community_name}',
+        f'/get_sorted?n={args.n}',
+        f'/get_sorted?n={args.n}&community_name={args.community_name}',
+        f'/get_hot?n={args.n}',
+    ]
+    timings, errors, elapsed = asyncio.run(run(args.url, paths, args.requests, args.concurrency))
+    timings.sort()
+    print(f"{args.url}: {len(timings)} requests, concurrency {args.concurrency}, {len(errors)} errors")
+    print(f"throughput {len(timings) / elapsed:.1f} req/s")
+    print(f"p50 {timings[len(timings) // 2] * 1000:.1f} ms, p99 {timings[int(len(timings) * 0.99) - 1] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark of the front server feed routes with and without backend connection reuse
+
+The feeds are rendered in process (Flask test client) while post_api and vote_api
+run as usual, e.g. foreman start -m post_db=1,post=1,vote=1
+The feed cache is emptied before every timed request so each one is rendered from
+the backends, --cached keeps it (every request after the warm up is a cache hit):
+report the two runs separately.
+Run from the repository root:
+python benchmarks/feed_latency.py
+python benchmarks/feed_latency.py --requests 200 --n 25
+python benchmarks/feed_latency.py --cached
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import backend_client  # noqa: E402
+import front_server  # noqa: E402
+
+
+def feed_urls(n, community_name):
+    return [
+        f'/get?n={n}',
+        f'/get?n={n}&community_name={community_name}',
+        f'/get_sorted?n={n}',
+        f'/get_sorted?n={n}&community_name={community_name}',
+        f'/get_hot?n={n}',
+    ]
+
+
+def run(client, url, requests_, cached=False):
+    timings = []
+    for _ in range(requests_):
+        if not cached:
+            front_server.feed_cache.clear()
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='requests per route and mode')
+    parser.add_argument('--n', type=int, default=25)
+    parser.add_argument('--community-name', default='csuf')
+    parser.add_argument('--cached', action='store_true', help='serve the feeds from the feed cache (cache hits)')
+    args = parser.parse_args()
+
+    client = front_server.app.test_client()
+    print(f"feed cache {'on' if args.cached else 'off'}")
+    print(f"{'route':<44}{'mode':<12}{'mean (ms)':>11}{'p50 (ms)':>11}{'p95 (ms)':>11}")
+    for url in feed_urls(args.n, args.community_name):
+        for keep_alive in (False, True):
+            backend_client.post_backend = backend_client.Backend(backend_client.POST_API_URL, keep_alive=keep_alive, name='post_api')
+            backend_client.vote_backend = backend_client.Backend(backend_client.VOTE_API_URL, keep_alive=keep_alive, name='vote_api')
+            client.get(url)  # warm up
+            mean, p50, p95 = run(client, url, args.requests, args.cached)
+            mode = 'keep-alive' if keep_alive else 'new conn'
+            print(f"{url:<44}{mode:<12}{mean * 1000:>11.2f}{p50 * 1000:>11.2f}{p95 * 1000:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
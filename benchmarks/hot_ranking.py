@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of hot ranking: scalar ranking.hot() + sorted() against
+the vectorized ranking.top_hot() (NumPy, argpartition)
+
+Posts are generated with scores and publication dates drawn like the dataset.
+Run from the repository root:
+python benchmarks/hot_ranking.py
+python benchmarks/hot_ranking.py --sizes 10000 100000 1000000 --k 25
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ranking import hot, hot_scores, top_hot  # noqa: E402
+
+
+# the ranking the front server used to compute, one hot() call per post and a full sort
+def top_hot_scalar(uuids, scores, dates, k):
+    hot_algo_dict = {}
+    for uuid, score, date in zip(uuids, scores, dates):
+        hot_algo_dict[uuid] = hot(score, date)
+    return sorted(hot_algo_dict, key=hot_algo_dict.get, reverse=True)[:k]
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--k', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=449)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'posts':>10}{'scalar (ms)':>14}{'numpy (ms)':>13}{'speedup':>10}{'max |diff|':>14}")
+    for size in args.sizes:
+        scores = np.round(rng.standard_cauchy(size) * 50).clip(-10 ** 6, 10 ** 6)
+        dates = rng.uniform(1.2e9, 1.6e9, size).round()
+        uuids = [str(i) for i in range(size)]
+        score_list = scores.tolist()
+        date_list = dates.tolist()
+
+        # same values as hot() for every post
+        expected = np.array([hot(s, d) for s, d in zip(score_list, date_list)])
+        diff = np.max(np.abs(hot_scores(scores, dates) - expected))
+        # same top k (ties aside)
+        top = top_hot(scores, dates, args.k)
+        assert np.allclose(expected[top], np.sort(expected)[::-1][:args.k], rtol=0, atol=1e-7)
+
+        scalar = best_of(lambda: top_hot_scalar(uuids, score_list, date_list, args.k), args.repeat)
+        vector = best_of(lambda: top_hot(scores, dates, args.k), args.repeat)
+        print(f"{size:>10}{scalar * 1000:>14.1f}{vector * 1000:>13.1f}{scalar / vector:>9.1f}x{diff:>14.2e}")
+
+
+if __name__ == '__main__':
+    main()
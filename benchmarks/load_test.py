@@ -0,0 +1,351 @@
+"""
+Load test of front_server, post_api and vote_api
+
+Starts the three Flask apps in a child process with local stand-ins for their
+stores: an in-process DynamoDB (moto) or DynamoDB Local on localhost:8000
+(dynamo.sh), and an in-process Redis (fakeredis) or the local redis-server.
+The request mix in --mix (JSON lines, see benchmarks/load_mix.jsonl) is
+replayed with --concurrency requests in flight. {uuid}, {published} and
+{community_name} in a path or json body are filled from a random post of
+data/posts.json, {voter} with the username of another random post.
+
+Reports throughput and p50/p95/p99 per route, and the DynamoDB calls, Redis
+round trips and inter-service HTTP calls made by the services. Results are
+saved as JSON, --compare prints the change against an earlier result.
+The in-process stand-ins share the CPU with the services (moto queries scan
+the whole table), so compare runs made with the same stores; use DynamoDB
+Local and redis-server for numbers closer to a deployment.
+
+Run from the repository root:
+python benchmarks/load_test.py
+python benchmarks/load_test.py --requests 5000 --concurrency 32 --dynamodb local --redis local
+python benchmarks/load_test.py --compare benchmarks/results/load_test-20200501-120000.json
+Running services can be targeted instead (no round trip counts):
+python benchmarks/load_test.py --front-url http://localhost:5000 --post-url http://localhost:5100 --vote-url http://localhost:5200
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ('front', 'post', 'vote')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# child process: run the three services until the parent sends 'stop'
+# the parent can also ask for the backend round trip counters ('counts') and zero them ('reset')
+def serve(options, conn):
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    ports = {name: free_port() for name in SERVICES}
+    os.environ['POST_API_URL'] = 'http://127.0.0.1:{}'.format(ports['post'])
+    os.environ['VOTE_API_URL'] = 'http://127.0.0.1:{}'.format(ports['vote'])
+    if options['no_feed_cache']:
+        os.environ['FEED_CACHE_TTL'] = '0'
+    for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+        os.environ.setdefault(name, 'local')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+
+    mock = None
+    if options['dynamodb'] == 'fake':
+        from moto import mock_aws
+        mock = mock_aws()
+        mock.start()
+
+    import boto3
+    from werkzeug.serving import make_server
+    import backend_client
+    import front_server
+    import metrics
+    import post_api
+    import vote_api
+
+    if mock is not None:
+        post_api.client = metrics.instrument_boto3(boto3.client('dynamodb'))
+    if options['redis'] == 'fake':
+        import fakeredis
+        vote_api.use_shards([metrics.instrument_redis(fakeredis.FakeStrictRedis(decode_responses=True))])
+
+    if not options['skip_load']:
+        try:
+            post_api.init_table()
+        except post_api.client.exceptions.ResourceInUseException:
+            pass
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'posts.json')
+            with open(path, 'w') as f:
+                json.dump({'data': options['posts']}, f)
+            post_api.load_posts(path, workers=options['load_workers'])
+        vote_api.load_votes()
+
+    counts = {'dynamodb': 0, 'redis': 0, 'http': 0}
+    lock = threading.Lock()
+
+    def count(backend):
+        with lock:
+            counts[backend] += 1
+
+    # one event per DynamoDB API call
+    post_api.client.meta.events.register('before-call.dynamodb', lambda **kwargs: count('dynamodb'))
+    # one write to the socket per command, or per pipeline / script call
+    for connection_class in {db.connection_pool.connection_class for db in vote_api.shards}:
+        def counting_send(self, *args, send_packed_command=connection_class.send_packed_command, **kwargs):
+            count('redis')
+            return send_packed_command(self, *args, **kwargs)
+        connection_class.send_packed_command = counting_send
+    # calls between the services
+    for backend in (backend_client.post_backend, backend_client.vote_backend):
+        backend.session.hooks['response'].append(lambda response, *args, **kwargs: count('http'))
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    servers = []
+    for name, app in (('front', front_server.app), ('post', post_api.app), ('vote', vote_api.app)):
+        server = make_server('127.0.0.1', ports[name], app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    conn.send({name: 'http://127.0.0.1:{}'.format(port) for name, port in ports.items()})
+
+    while True:
+        command = conn.recv()
+        if command == 'reset':
+            with lock:
+                counts.update(dict.fromkeys(counts, 0))
+            conn.send(True)
+        elif command == 'counts':
+            with lock:
+                conn.send(dict(counts))
+        else:
+            break
+    for server in servers:
+        server.shutdown()
+    if mock is not None:
+        mock.stop()
+    conn.send(True)
+
+
+def read_mix(path):
+    mix = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entry.setdefault('method', 'GET')
+                entry.setdefault('weight', 1)
+                entry.setdefault('name', '{} {} {}'.format(entry['service'], entry['method'], entry['path']))
+                mix.append(entry)
+    return mix
+
+
+def fill(value, values):
+    if isinstance(value, str):
+        for name, text in values.items():
+            value = value.replace('{' + name + '}', text)
+        return value
+    if isinstance(value, list):
+        return [fill(x, values) for x in value]
+    if isinstance(value, dict):
+        return {k: fill(v, values) for k, v in value.items()}
+    return value
+
+
+# the requests sent by a run, drawn from the mix by weight
+def plan(mix, posts, requests_, rng):
+    entries = rng.choices(mix, weights=[entry['weight'] for entry in mix], k=requests_)
+    planned = []
+    for entry in entries:
+        post = rng.choice(posts)
+        values = {name: str(post[name]) for name in ('uuid', 'published', 'community_name')}
+        values['voter'] = str(rng.choice(posts)['username'])
+        planned.append((entry['name'], entry['service'], entry['method'],
+                        fill(entry['path'], values), fill(entry.get('json'), values)))
+    return planned
+
+
+async def worker(session, urls, planned, results):
+    for name, service, method, path, body in planned:
+        start = time.perf_counter()
+        try:
+            async with session.request(method, urls[service] + path, json=body) as resp:
+                await resp.read()
+                status = resp.status
+        except aiohttp.ClientError as e:
+            status = repr(e)
+        results.append((name, status, time.perf_counter() - start))
+
+
+async def replay(urls, planned, concurrency):
+    # one shared iterator, so the workers split the requests between them
+    planned = iter(planned)
+    results = []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(session, urls, planned, results) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def percentile(timings, q):
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+def summarize(results, elapsed):
+    routes = {}
+    for name, status, timing in results:
+        route = routes.setdefault(name, {'timings': [], 'errors': 0})
+        route['timings'].append(timing)
+        # 409: a voter voting the same way twice
+        if status not in (200, 201, 409):
+            route['errors'] += 1
+    report = {}
+    for name, route in sorted(routes.items()) + [('total', {'timings': [t for _, _, t in results],
+                                                            'errors': sum(r['errors'] for r in routes.values())})]:
+        timings = sorted(route['timings'])
+        report[name] = {
+            'requests': len(timings),
+            'errors': route['errors'],
+            'throughput': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+        }
+    return report
+
+
+def print_report(result):
+    print(f"{'route':<28}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, row in result['routes'].items():
+        print(f"{name:<28}{row['requests']:>9}{row['errors']:>8}{row['throughput']:>9}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+    if result['round_trips']:
+        requests_ = result['routes']['total']['requests']
+        print("backend round trips: " + ", ".join(f"{backend} {n} ({n / requests_:.2f}/request)"
+                                                 for backend, n in result['round_trips'].items()))
+
+
+def print_comparison(result, previous):
+    print(f"compared with {previous['started']} ({previous.get('commit') or 'unknown commit'})")
+    print(f"{'route':<28}{'req/s':>20}{'p50 ms':>20}{'p99 ms':>20}")
+    for name, row in result['routes'].items():
+        old = previous['routes'].get(name)
+        if old is None:
+            continue
+        print(f"{name:<28}" + "".join(f"{old[key]:>9} -> {row[key]:<7}" for key in ('throughput', 'p50_ms', 'p99_ms')))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default=os.path.join(ROOT, 'benchmarks', 'load_mix.jsonl'))
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dynamodb', choices=('fake', 'local'), default='fake',
+                        help='in-process moto or DynamoDB Local on localhost:8000')
+    parser.add_argument('--redis', choices=('fake', 'local'), default='fake',
+                        help='in-process fakeredis or the redis servers of VOTE_REDIS_URLS (localhost:6379 by default)')
+    parser.add_argument('--skip-load', action='store_true', help='the local stores are already loaded')
+    parser.add_argument('--posts', type=int, default=1000,
+                        help='posts of data/posts.json loaded and requested (0: all), moto slows down with the table size')
+    parser.add_argument('--load-workers', type=int, default=8)
+    parser.add_argument('--no-feed-cache', action='store_true', help='render every feed (FEED_CACHE_TTL=0)')
+    parser.add_argument('--front-url')
+    parser.add_argument('--post-url')
+    parser.add_argument('--vote-url')
+    parser.add_argument('--output', help='result file (default benchmarks/results/load_test-<time>.json)')
+    parser.add_argument('--compare', help='earlier result file')
+    args = parser.parse_args()
+
+    mix = read_mix(args.mix)
+    with open(os.path.join(ROOT, 'data', 'posts.json')) as f:
+        posts = json.load(f)['data']
+    if args.posts:
+        posts = posts[:args.posts]
+    rng = random.Random(args.seed)
+    warmup = plan(mix, posts, args.warmup, rng)
+    planned = plan(mix, posts, args.requests, rng)
+
+    child = None
+    external = args.front_url or args.post_url or args.vote_url
+    if external:
+        urls = {'front': args.front_url, 'post': args.post_url, 'vote': args.vote_url}
+        missing = {entry['service'] for entry in mix if not urls[entry['service']]}
+        if missing:
+            parser.error('no url for ' + ', '.join(sorted(missing)))
+    else:
+        conn, child_conn = multiprocessing.Pipe()
+        options = {'dynamodb': args.dynamodb, 'redis': args.redis, 'skip_load': args.skip_load, 'posts': posts,
+                   'load_workers': args.load_workers, 'no_feed_cache': args.no_feed_cache}
+        child = multiprocessing.get_context('spawn').Process(target=serve, args=(options, child_conn))
+        child.start()
+        urls = conn.recv()
+
+    started = datetime.datetime.now()
+    try:
+        asyncio.run(replay(urls, warmup, args.concurrency))
+        if child is not None:
+            conn.send('reset')
+            conn.recv()
+        results, elapsed = asyncio.run(replay(urls, planned, args.concurrency))
+        round_trips = {}
+        if child is not None:
+            conn.send('counts')
+            round_trips = conn.recv()
+    finally:
+        if child is not None:
+            conn.send('stop')
+            conn.recv()
+            child.join()
+
+    result = {
+        'started': started.isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {'mix': os.path.relpath(args.mix, ROOT), 'requests': args.requests,
+                   'concurrency': args.concurrency, 'seed': args.seed, 'posts': len(posts),
+                   'dynamodb': 'external' if external else args.dynamodb,
+                   'redis': 'external' if external else args.redis,
+                   'feed_cache': not args.no_feed_cache},
+        'elapsed': round(elapsed, 3),
+        'routes': summarize(results, elapsed),
+        'round_trips': round_trips,
+    }
+    print_report(result)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         'load_test-{}.json'.format(started.strftime('%Y%m%d-%H%M%S')))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark of vote throughput with and without write-behind coalescing
+
+Threads send upvotes for the --posts top posts of the score index through
+vote_api.apply_vote(), first with one script call per vote, then with a
+VoteCoalescer for every --windows value (milliseconds). Reports votes/s and
+Redis round trips per vote, checks that every vote reached the score index and
+takes the votes back afterwards.
+
+Requires a local redis-server on localhost:6379 loaded with FLASK_APP=vote_api.py flask init,
+or --fake to run on an in-process fakeredis loaded from data/votes.json.
+Run from the repository root:
+python benchmarks/vote_coalescing.py
+python benchmarks/vote_coalescing.py --posts 1 --threads 16 --votes 50000 --windows 10 50 100
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vote_api  # noqa: E402
+from vote_coalescer import VoteCoalescer  # noqa: E402
+
+
+# connection that counts every write to the socket, i.e. every round trip
+class CountingConnection(redis.Connection):
+    round_trips = 0
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        return super().send_packed_command(command, check_health)
+
+
+# count the round trips of another connection class (fakeredis) like CountingConnection
+def count_round_trips(connection_class):
+    send_packed_command = connection_class.send_packed_command
+
+    def counting_send(self, *args, **kwargs):
+        CountingConnection.round_trips += 1
+        return send_packed_command(self, *args, **kwargs)
+    connection_class.send_packed_command = counting_send
+
+
+def vote(uuids, votes, threads, seed):
+    def worker(n, rng):
+        for _ in range(n):
+            vote_api.apply_vote(rng.choice(uuids), 1)
+
+    workers = [threading.Thread(target=worker, args=(votes // threads, random.Random(seed + i)))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return votes // threads * threads
+
+
+def run(r, uuids, args, window):
+    before = dict(zip(uuids, r.zmscore(vote_api.score_key(), uuids)))
+    if window is not None:
+        vote_api.vote_coalescer = VoteCoalescer(vote_api.get_vote_row, vote_api.flush_votes, window=window / 1000)
+    CountingConnection.round_trips = 0
+    start = time.perf_counter()
+    votes = vote(uuids, args.votes, args.threads, args.seed)
+    if window is not None:
+        # the last window is part of the run
+        vote_api.vote_coalescer.close()
+        vote_api.vote_coalescer = None
+    elapsed = time.perf_counter() - start
+    trips = CountingConnection.round_trips
+
+    after = dict(zip(uuids, r.zmscore(vote_api.score_key(), uuids)))
+    applied = {uuid: int(after[uuid] - before[uuid]) for uuid in uuids}
+    if sum(applied.values()) != votes:
+        raise RuntimeError(f"{votes} votes sent, {sum(applied.values())} applied")
+    # take the votes back
+    vote_api.flush_votes({uuid: -n for uuid, n in applied.items() if n})
+    return votes / elapsed, trips / votes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=1)
+    parser.add_argument('--fake', action='store_true', help='in-process fakeredis instead of redis-server')
+    parser.add_argument('--posts', type=int, default=1, help='number of posts receiving the votes')
+    parser.add_argument('--votes', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--windows', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.fake:
+        import fakeredis
+        r = fakeredis.FakeStrictRedis(decode_responses=True)
+        count_round_trips(r.connection_pool.connection_class)
+        vote_api.use_shards([r])
+        vote_api.load_votes()
+    else:
+        r = redis.StrictRedis(host=args.host, port=args.port, db=args.db, decode_responses=True,
+                              connection_class=CountingConnection,
+                              max_connections=args.threads * 2)
+        vote_api.use_shards([r])
+    uuids = r.zrange(vote_api.score_key(), 0, args.posts - 1, desc=True)
+    print(f"{args.votes} upvotes on {len(uuids)} posts, {args.threads} threads")
+
+    print(f"{'mode':<24}{'votes/s':>12}{'round trips/vote':>18}")
+    throughput, trips = run(r, uuids, args, None)
+    print(f"{'script call per vote':<24}{throughput:>12.0f}{trips:>18.3f}")
+    for window in args.windows:
+        throughput, trips = run(r, uuids, args, window)
+        print(f"{'coalesced ' + str(window) + ' ms':<24}{throughput:>12.0f}{trips:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark for hydrating vote rows out of Redis
+
+Compares the old read path (three HGET round trips per uuid) with the
+pipelined HMGET batches used by vote_api.get_votes() for the /get_all endpoint.
+
+Requires a local redis-server on localhost:6379 loaded with FLASK_APP=vote_api.py flask init,
+run from the repository root:
+python benchmarks/vote_reads.py
+python benchmarks/vote_reads.py --batch-size 100 500 2000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import redis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vote_api  # noqa: E402
+
+
+# connection that counts every write to the socket, i.e. every round trip
+# a pipeline packs all of its commands into a single write
+class CountingConnection(redis.Connection):
+    round_trips = 0
+
+    def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        return super().send_packed_command(command, check_health)
+
+
+# the read path vote_api used before batching
+def get_votes_naive(r, uuids):
+    rows = []
+    for uuid in uuids:
+        score = r.hget(uuid, "score")
+        published = r.hget(uuid, "published")
+        community_name = r.hget(uuid, "community_name")
+        if score is not None:
+            rows.append({'uuid': uuid, 'score': score, 'published': published, 'community_name': community_name})
+    return rows
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        CountingConnection.round_trips = 0
+        start = time.perf_counter()
+        rows = fn()
+        timings.append(time.perf_counter() - start)
+    return len(rows), CountingConnection.round_trips, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    r = redis.StrictRedis(host=args.host, port=args.port, db=args.db, decode_responses=True,
+                          connection_class=CountingConnection)
+    vote_api.use_shards([r])
+    uuids = r.zrange("score", 0, -1, desc=True)
+    print(f"{len(uuids)} uuids in the score index")
+
+    print(f"{'read path':<24}{'rows':>8}{'round trips':>14}{'best (ms)':>12}")
+    rows, trips, best = measure(lambda: get_votes_naive(r, uuids), args.repeat)
+    print(f"{'hget x3 per uuid':<24}{rows:>8}{trips:>14}{best * 1000:>12.1f}")
+    for batch_size in args.batch_size:
+        rows, trips, best = measure(lambda: vote_api.get_votes(uuids, batch_size), args.repeat)
+        print(f"{'hmget batch ' + str(batch_size):<24}{rows:>8}{trips:>14}{best * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
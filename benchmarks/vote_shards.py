@@ -0,0 +1,173 @@
+"""
+Benchmark of vote throughput over 1 to N Redis shards
+
+For every shard count in --shards, vote_api is pointed at the first servers
+(VOTE_REDIS_URLS), data/votes.json is loaded again with flask init --force
+semantics, and the merged rankings are checked against the one shard run:
+the first --check pages of the score, hot and published indexes (followed with
+X-Next-Cursor cursors) and the rank of their posts must be the same. Then
+--processes worker processes send --votes upvotes on random posts through
+vote_api.apply_vote() and the votes/s are reported.
+
+Each shard is a separate redis-server: --spawn starts N of them on free ports
+(redis-server must be on the PATH), --urls uses running ones, --fake starts
+fakeredis TCP servers (checks the merge only, their throughput means nothing).
+Run from the repository root:
+python benchmarks/vote_shards.py --spawn 4
+python benchmarks/vote_shards.py --urls redis://localhost:6379/1 redis://localhost:6380/1 --processes 8
+python benchmarks/vote_shards.py --fake 3 --votes 2000
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def serve_fake(port):
+    import fakeredis
+    fakeredis.TcpFakeServer(('127.0.0.1', port)).serve_forever()
+
+
+# start the shard servers, returns their URLs and the processes to stop
+def start_servers(args):
+    if args.urls:
+        return args.urls, []
+    count = args.spawn or args.fake
+    ports = [free_port() for _ in range(count)]
+    if args.spawn:
+        if shutil.which('redis-server') is None:
+            raise SystemExit('redis-server not found on the PATH')
+        processes = [subprocess.Popen(['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'],
+                                      stdout=subprocess.DEVNULL) for port in ports]
+    else:
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=serve_fake, args=(port,), daemon=True) for port in ports]
+        for process in processes:
+            process.start()
+    for port in ports:
+        wait_for_port(port)
+    return ['redis://127.0.0.1:{}/0'.format(port) for port in ports], processes
+
+
+def connect(urls):
+    os.environ['VOTE_REDIS_URLS'] = ','.join(urls)
+    os.chdir(ROOT)
+    import vote_api
+    vote_api.use_shards(vote_api.init_db(urls))
+    return vote_api
+
+
+# pages of the global indexes and the rank of the posts on them
+def rankings(vote_api, pages, limit=50):
+    result = {}
+    for by, key in vote_api.RANK_INDEXES.items():
+        cursor, uuids = None, []
+        for _ in range(pages):
+            page, next_cursor = vote_api.index_page(key(), limit, cursor=cursor and vote_api.parse_cursor(cursor))
+            uuids += page
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        with vote_api.app.test_client() as client:
+            ranks = [client.get('/rank', query_string={'uuid': uuid, 'by': by}).get_json()['rank']
+                     for uuid in uuids[::limit // 5]]
+        result[by] = (uuids, ranks)
+    return result
+
+
+def init_worker(urls):
+    global worker_api
+    worker_api = connect(urls)
+    # load the vote script up front instead of on the first NOSCRIPT reply
+    for db in worker_api.shards:
+        db.script_load(worker_api.VOTE_SCRIPT)
+
+
+def vote(job):
+    uuids, votes, seed = job
+    rng = random.Random(seed)
+    for _ in range(votes):
+        worker_api.apply_vote(rng.choice(uuids), 1)
+    return votes
+
+
+def run(urls, uuids, args):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes, initializer=init_worker, initargs=(urls,)) as pool:
+        # connections are set up outside the measure
+        pool.map(vote, [(uuids, 10, i) for i in range(args.processes)])
+        per_process = args.votes // args.processes
+        start = time.perf_counter()
+        votes = sum(pool.map(vote, [(uuids, per_process, args.seed + i) for i in range(args.processes)]))
+        elapsed = time.perf_counter() - start
+    return votes / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    servers = parser.add_mutually_exclusive_group(required=True)
+    servers.add_argument('--spawn', type=int, help='start this many redis-server processes')
+    servers.add_argument('--urls', nargs='+', help='redis URLs of running servers (they are flushed)')
+    servers.add_argument('--fake', type=int, help='start this many fakeredis TCP servers')
+    parser.add_argument('--shards', type=int, nargs='+', help='shard counts to run (default 1 to all servers)')
+    parser.add_argument('--votes', type=int, default=50000)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    parser.add_argument('--check', type=int, default=4, help='pages of 50 rows compared between shard counts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    urls, processes = start_servers(args)
+    try:
+        vote_api = connect(urls)
+        with open(os.path.join(ROOT, vote_api.DATABASE_DATA)) as f:
+            uuids = [d['uuid'] for d in json.load(f)['data']]
+        print(f"{args.votes} upvotes on {len(uuids)} posts, {args.processes} processes")
+        print(f"{'shards':<8}{'votes/s':>12}{'speedup':>10}")
+        reference = baseline = None
+        for count in args.shards or range(1, len(urls) + 1):
+            vote_api.use_shards(vote_api.init_db(urls[:count]))
+            with contextlib.redirect_stdout(io.StringIO()):
+                vote_api.load_votes(force=True)
+            merged = rankings(vote_api, args.check)
+            if reference is None:
+                reference = merged
+            elif merged != reference:
+                raise RuntimeError(f"rankings over {count} shards differ from the first run")
+            throughput = run(urls[:count], uuids, args)
+            baseline = baseline or throughput
+            print(f"{count:<8}{throughput:>12.0f}{throughput / baseline:>10.2f}")
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
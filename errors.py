@@ -0,0 +1,13 @@
+"""
+Errors shared by the front servers (front_server.py and front_async.py)
+"""
+
+
+class APIError(Exception):
+    """throws API error exception"""
+
+    def __init__(self, status):
+        self.status = status
+
+    def __str__(self):
+        return {"APIError: status": str(self.status)}
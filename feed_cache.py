@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+"""
+Bounded cache of rendered RSS feeds
+
+Entries are keyed by (route, n, community_name, cursor) and hold the rendered bytes
+with a strong ETag. They expire after ttl seconds and the least recently used
+entry is evicted once the cache holds max_size feeds. A ttl of 0 turns the cache off.
+"""
+
+
+class FeedCache:
+    """LRU cache with TTL of rendered feeds"""
+
+    def __init__(self, max_size=256, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(route, n, community_name=None, cursor=None):
+        return route, str(n), community_name, cursor
+
+    # url of a feed page built from the values of its cache key only, so a cached feed links the same next page
+    # whatever the Host header and the other parameters of the request that rendered it
+    # base_url is the public url of the server, the url is relative to the host when it is empty
+    @staticmethod
+    def page_url(base_url, route, n, community_name=None, cursor=None):
+        params = [(name, value) for name, value in (('n', n), ('community_name', community_name), ('cursor', cursor))
+                  if value is not None]
+        return base_url.rstrip('/') + route + '?' + urlencode(params)
+
+    @staticmethod
+    def etag(body):
+        return hashlib.sha1(body).hexdigest()
+
+    # return (body, etag, headers) of a cached feed or None if missing or expired
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1], entry[3]
+
+    # store a rendered feed with the headers sent along with it and return its etag
+    # nothing is stored with a ttl of 0 (cache off)
+    def put(self, key, body, headers=None):
+        etag = self.etag(body)
+        if self.ttl <= 0:
+            return etag
+        with self.lock:
+            self.entries[key] = (body, etag, time.monotonic() + self.ttl, headers or {})
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return etag
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
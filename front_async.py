@@ -0,0 +1,235 @@
+import asyncio
+import functools
+import os
+import time
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp import web
+import metrics
+from backend_client import POST_API_URL, VOTE_API_URL, POOL_SIZE, CONNECT_TIMEOUT, READ_TIMEOUT
+from errors import APIError
+from feed_cache import FeedCache
+from rss import render_rss
+
+"""
+---------------------Asynchronous Backend for Frontend---------------------------
+Serves the same RSS feeds as front_server.py on an asyncio event loop, so one
+process keeps many feed requests in flight while it waits on post_api and vote_api.
+Backend calls share one aiohttp session (keep-alive connection pool), and long
+uuid lists sent to post_api /get_uuids are split in chunks fetched concurrently.
+
+Run with
+gunicorn3 --bind 127.0.0.1:5001 --worker-class aiohttp.GunicornWebWorker front_async:app
+or
+python front_async.py
+
+http://localhost:5001/get?n=25&community_name=csuf
+http://localhost:5001/get?n=25&cursor=<X-Next-Cursor of the previous page>
+http://localhost:5001/get_sorted?n=25
+http://localhost:5001/get_hot?n=25&community_name=csuf
+"""
+
+# number of uuids sent in each concurrent /get_uuids call
+UUID_CHUNK_SIZE = 25
+# connections kept per backend
+BACKEND_LIMIT = POOL_SIZE * 10
+
+# rendered feeds kept in memory and seconds before they are rendered again (same settings as front_server)
+feed_cache = FeedCache(max_size=int(os.environ.get('FEED_CACHE_SIZE', 256)),
+                       ttl=int(os.environ.get('FEED_CACHE_TTL', 30)))
+# feeds of at least this many posts are not cached (same setting as front_server)
+FEED_STREAM_MIN_N = int(os.environ.get('FEED_STREAM_MIN_N', 100))
+# public url of the server used in the next page links, relative links when empty (same setting as front_server)
+FEED_BASE_URL = os.environ.get('FEED_BASE_URL', '')
+
+
+# names of the backends in the backend latency metric
+BACKEND_NAMES = {urlsplit(POST_API_URL).netloc: 'post_api', urlsplit(VOTE_API_URL).netloc: 'vote_api'}
+
+
+# time the backend calls of the shared session (same metric as backend_client)
+async def on_backend_start(session, context, params):
+    context.start = time.perf_counter()
+
+
+async def on_backend_end(session, context, params):
+    name = BACKEND_NAMES.get(params.url.raw_authority, params.url.raw_authority)
+    metrics.observe_backend('http', '{} {}'.format(name, params.url.path), time.perf_counter() - context.start)
+
+
+def backend_trace():
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_backend_start)
+    trace.on_request_end.append(on_backend_end)
+    return trace
+
+
+# create the shared backend session when the app starts and close it on shutdown
+async def backend_session(app):
+    timeout = aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit_per_host=BACKEND_LIMIT)
+    app['backend'] = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[backend_trace()])
+    yield
+    await app['backend'].close()
+
+
+# GET a backend url and return the json body with the X-Next-Cursor header of the response
+async def get_json_page(session, url, params):
+    async with session.get(url, params=params) as resp:
+        if resp.status == 400 and 'cursor' in params:
+            raise web.HTTPBadRequest(text='"Invalid cursor"', content_type='application/json')
+        if resp.status != 200:
+            # This means something went wrong.
+            raise APIError(resp.status)
+        return await resp.json(content_type=None), resp.headers.get('X-Next-Cursor')
+
+
+# retrieve the posts of a list of uuids from post_api, chunks are fetched concurrently
+# the posts are returned in the order of uuids
+async def get_posts(session, uuids):
+    async def get_chunk(chunk):
+        async with session.post(POST_API_URL + '/get_uuids', json={"uuid": chunk}) as resp:
+            if resp.status != 200:
+                raise APIError(resp.status)
+            return await resp.json(content_type=None)
+
+    chunks = [uuids[i:i + UUID_CHUNK_SIZE] for i in range(0, len(uuids), UUID_CHUNK_SIZE)]
+    posts = []
+    for chunk_posts in await asyncio.gather(*[get_chunk(chunk) for chunk in chunks]):
+        posts += chunk_posts
+    return posts
+
+
+# retrieve the posts ranked by a vote_api route (/get sorted by score or /hot) and the cursor of the next page
+# rows carrying the post summary stored by vote_api are used as they are, only the others
+# are retrieved from post_api
+async def get_ranked_posts(session, path, params):
+    params['summary'] = 'True'
+    vote_data, next_cursor = await get_json_page(session, VOTE_API_URL + path, params)
+    # full primary key lets post_api use BatchGetItem
+    missing = [{"uuid": dic["uuid"], "published": dic["published"]} for dic in vote_data if 'title' not in dic]
+    if not missing:
+        return vote_data, next_cursor
+    posts = {dic['uuid']: dic for dic in await get_posts(session, missing)}
+    return [dic if 'title' in dic else posts[dic['uuid']]
+            for dic in vote_data if 'title' in dic or dic['uuid'] in posts], next_cursor
+
+
+# feed of a list of posts, next_cursor is the backend token of the following page
+def rss_response(request, posts, next_cursor=None):
+    next_url = None
+    headers = {}
+    if next_cursor:
+        next_url = FeedCache.page_url(FEED_BASE_URL, request.path, request.query.get('n'),
+                                      request.query.get('community_name'), next_cursor)
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    return web.Response(text=render_rss(posts, next_url), content_type='application/rss+xml', headers=headers)
+
+
+# send a rendered feed with its ETag and paging headers, 304 Not Modified when the client already has it
+def feed_response(request, body, etag, paging=None):
+    quoted = '"{}"'.format(etag)
+    headers = {'ETag': quoted, 'Cache-Control': 'public, max-age={}'.format(feed_cache.ttl)}
+    headers.update(paging or {})
+    if_none_match = [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+    if quoted in if_none_match or '*' in if_none_match:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=body, content_type='application/rss+xml', headers=headers)
+
+
+# decorator serving a feed handler from feed_cache, keyed by route, n, community_name and cursor
+# large feeds (n >= FEED_STREAM_MIN_N) skip the cache
+def cached_feed(handler):
+    @functools.wraps(handler)
+    async def wrapper(request):
+        params = feed_params(request)
+        if params['n'] >= FEED_STREAM_MIN_N:
+            return await handler(request)
+        key = FeedCache.key(request.path, params['n'], params.get('community_name'), params.get('cursor'))
+        cached = feed_cache.get(key)
+        if cached is None:
+            response = await handler(request)
+            body = response.body
+            paging = {name: response.headers[name] for name in ('X-Next-Cursor', 'Link') if name in response.headers}
+            etag = feed_cache.put(key, body, paging)
+        else:
+            body, etag, paging = cached
+        return feed_response(request, body, etag, paging)
+    return wrapper
+
+
+def feed_params(request):
+    if request.query.get('n') is None:
+        raise web.HTTPNotFound(text='"Enter value of n"', content_type='application/json')
+    params = {'n': int(request.query['n'])}
+    if request.query.get('community_name') is not None:
+        params['community_name'] = str(request.query['community_name'])
+    if request.query.get('cursor'):
+        params['cursor'] = request.query['cursor']
+    return params
+
+
+# The n most recent posts to a particular community or to any community
+@cached_feed
+async def get_recent_post(request):
+    params = feed_params(request)
+    params['recent'] = 'True'
+    posts, next_cursor = await get_json_page(request.app['backend'], POST_API_URL + '/get', params)
+    return rss_response(request, posts, next_cursor)
+
+
+# The top n posts to a particular community or to any community, sorted by score
+@cached_feed
+async def get_recent_post_sorted(request):
+    params = feed_params(request)
+    params['sorted'] = 'True'
+    posts, next_cursor = await get_ranked_posts(request.app['backend'], '/get', params)
+    return rss_response(request, posts, next_cursor)
+
+
+# The hot n posts to a particular community or to any community
+@cached_feed
+async def get_hot_post(request):
+    params = feed_params(request)
+    posts, next_cursor = await get_ranked_posts(request.app['backend'], '/hot', params)
+    return rss_response(request, posts, next_cursor)
+
+
+# time every request by route, like metrics.init_app does for the Flask services
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else 'unmatched'
+        metrics.observe_request('front_async', request.method, route, status, time.perf_counter() - start)
+
+
+async def get_metrics(request):
+    return web.Response(text=metrics.render(), content_type='text/plain')
+
+
+def create_app():
+    app = web.Application(middlewares=[metrics_middleware])
+    app.cleanup_ctx.append(backend_session)
+    app.router.add_get('/metrics', get_metrics)
+    app.router.add_get('/get', get_recent_post)
+    app.router.add_get('/get_sorted', get_recent_post_sorted)
+    app.router.add_get('/get_hot', get_hot_post)
+    return app
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    web.run_app(app, host='127.0.0.1', port=5001)
@@ -1,18 +1,33 @@
-import math, json, requests
-from flask import Flask, jsonify, request, send_from_directory,make_response
-from rfeed import *
-from datetime import datetime
+import functools
+import os
+import backend_client
+import metrics
+from errors import APIError
+from feed_cache import FeedCache
+from flask import Flask, Response, jsonify, request, send_from_directory,make_response
+from rss import rss_chunks
 
 # flask globals
 app = Flask(__name__)
 
 # flask config variables
 app.config['DEBUG'] = True
+# rendered feeds kept in memory and seconds before they are rendered again
+app.config['FEED_CACHE_SIZE'] = int(os.environ.get('FEED_CACHE_SIZE', 256))
+app.config['FEED_CACHE_TTL'] = int(os.environ.get('FEED_CACHE_TTL', 30))
+# feeds of at least this many posts are streamed to the client instead of being cached
+app.config['FEED_STREAM_MIN_N'] = int(os.environ.get('FEED_STREAM_MIN_N', 100))
+# public url of the server (e.g. https://feeds.example.com) used in the next page links, relative links when empty
+app.config['FEED_BASE_URL'] = os.environ.get('FEED_BASE_URL', '')
 
+feed_cache = FeedCache(max_size=app.config['FEED_CACHE_SIZE'], ttl=app.config['FEED_CACHE_TTL'])
+# request latency per route on /metrics
+metrics.init_app(app, 'front_server')
+# headers of a feed response kept with the cached feed
+PAGING_HEADERS = ('X-Next-Cursor', 'Link')
 
-# static values
-POST_PORT_NO=5100 #set port number for post_api
-VOTE_PORT_NO=5200 #set port number for vote_api
+
+# backend urls, pool sizes and timeouts are configured in backend_client
 
 
 # n not found error
@@ -37,14 +52,73 @@ def get_response(status_code, message):
 
 
 
-class APIError(Exception):
-    """throws API error exception"""
+# helper function to stream the RSS feed of a list of posts as a chunked response
+# next_cursor is the backend token of the following page, linked from the feed and sent in X-Next-Cursor
+def rss_response(posts, next_cursor=None):
+    next_url = None
+    headers = {}
+    if next_cursor:
+        next_url = FeedCache.page_url(app.config['FEED_BASE_URL'], request.path, request.args.get('n'),
+                                      request.args.get('community_name'), next_cursor)
+        headers['X-Next-Cursor'] = next_cursor
+        headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    return Response(rss_chunks(posts, next_url), mimetype='application/rss+xml', headers=headers)
+
+
+# helper function to send a rendered feed with its ETag
+# answers 304 Not Modified when the client already has this version of the feed
+# headers are the paging headers (X-Next-Cursor, Link) of the feed
+def feed_response(body, etag, headers=None):
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(body)
+        response.headers.set('Content-Type', 'application/rss+xml')
+    for name, value in (headers or {}).items():
+        response.headers.set(name, value)
+    response.set_etag(etag)
+    response.headers.set('Cache-Control', 'public, max-age={}'.format(feed_cache.ttl))
+    return response
+
+
+# decorator serving a feed route from feed_cache, keyed by route, n, community_name and cursor
+# the backends are only called when the feed is not cached or has expired
+# large feeds (n >= FEED_STREAM_MIN_N) skip the cache and are streamed as rendered
+def cached_feed(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        params = request.args
+        if params.get('n') is None or int(params['n']) >= app.config['FEED_STREAM_MIN_N']:
+            return view(*args, **kwargs)
+        key = FeedCache.key(request.path, params['n'], params.get('community_name'), params.get('cursor'))
+        cached = feed_cache.get(key)
+        if cached is None:
+            response = view(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            headers = {name: response.headers[name] for name in PAGING_HEADERS if name in response.headers}
+            etag = feed_cache.put(key, body, headers)
+        else:
+            body, etag, headers = cached
+        return feed_response(body, etag, headers)
+    return wrapper
 
-    def __init__(self, status):
-        self.status = status
 
-    def __str__(self):
-        return {"APIError: status": str(self.status)}
+# helper function to turn vote_api rows into posts, keeping their order
+# rows carrying the post summary stored by vote_api are used as they are,
+# only the others are retrieved from post_api
+def hydrate_posts(vote_data):
+    # full primary key lets post_api use BatchGetItem
+    missing = [{"uuid": dic["uuid"], "published": dic["published"]} for dic in vote_data if 'title' not in dic]
+    if not missing:
+        return vote_data
+    post_resp = backend_client.post_backend.post('/get_uuids', json={"uuid": missing})
+    if post_resp.status_code != 200:
+        raise APIError(post_resp.status_code)
+    posts = {dic['uuid']: dic for dic in post_resp.json()}
+    return [dic if 'title' in dic else posts[dic['uuid']]
+            for dic in vote_data if 'title' in dic or dic['uuid'] in posts]
 
 
 
@@ -53,11 +127,13 @@ class APIError(Exception):
 #2) The 25 most recent posts to any community
 #http://localhost:5000/get?n=25
 @app.route('/get', methods=["GET"])
+@cached_feed
 def get_recent_post():
     """
-        This route takes ONE or TWO arguments
+        This route takes ONE to THREE arguments
         n: Number of Posts (mandatory or required)
         community_name : Name of community
+        cursor : token of the next page, sent in the X-Next-Cursor header and the atom:link of a feed
 
     """
 
@@ -68,43 +144,23 @@ def get_recent_post():
         no_of_post=int(params['n'])
         # got number of post, now fetching data using post API
 
+        post_params = {'n': no_of_post, 'recent': True}
         if params.get('community_name') is not None:
-            community_name=str(params['community_name'])
-            post_resp = requests.get('http://127.0.0.1:{}/get?n={}&community_name={}&recent=True'.format(POST_PORT_NO,no_of_post,community_name))
-        else:
-            post_resp = requests.get('http://127.0.0.1:{}/get?n={}&recent=True'.format(POST_PORT_NO,no_of_post))
-
+            post_params['community_name'] = str(params['community_name'])
+        # continue after the page the cursor was returned with
+        if params.get('cursor'):
+            post_params['cursor'] = params['cursor']
+        post_resp = backend_client.post_backend.get('/get', params=post_params)
+
+        if post_resp.status_code == 400:
+            return custom_error("Invalid cursor", 400)
         if post_resp.status_code != 200:
         # This means something went wrong.
             raise APIError(post_resp.status_code)
         data=post_resp.json() # convert fetch data to python list of dict
 
-        # generate RSS
-        rss_list=[]
-        for dic in data:
-            date = datetime.fromtimestamp(int(dic['published']))
-
-            item1 = Item(
-                title = dic.get('title',"") or "", # get title form dict or empty string
-                link = dic.get('url',"") or "",
-                description = dic.get('description',"") or "",
-                author = dic.get('username',"") or "",
-                guid = Guid(dic.get('url',"") or ""),
-                categories= dic.get('community_name',"") or "",
-                pubDate = date)
-            rss_list.append(item1)
-
-        feed = Feed(
-            title = "Reddit clone RSS Feed",
-            link = "http://www.example.com/rss",
-            description = "This is project-2 for CPSC-449 an RSS 2.0 feed",
-            language = "en-US",
-            lastBuildDate = datetime.now(),
-            items = rss_list)
-
-        response = make_response(feed.rss())
-        response.headers.set('Content-Type', 'application/rss+xml')
-        return response
+        # generate RSS, linking the next page
+        return rss_response(data, post_resp.headers.get('X-Next-Cursor'))
 
 
     else:
@@ -115,12 +171,15 @@ def get_recent_post():
 # http://localhost:5000/get_sorted?n=25&community_name=csuf
 # 4) The top 25 posts to any community, sorted by score
 # http://localhost:5000/get_sorted?n=25
+# next pages: http://localhost:5000/get_sorted?n=25&cursor=<X-Next-Cursor of the previous page>
 @app.route('/get_sorted', methods=["GET"])
+@cached_feed
 def get_recent_post_scorted():
     """
-        This route takes ONE or TWO arguments
+        This route takes ONE to THREE arguments
         n: Number of Posts (mandatory or required)
         community_name : Name of community
+        cursor : token of the next page, sent in the X-Next-Cursor header and the atom:link of a feed
 
     """
     params = request.args
@@ -128,55 +187,24 @@ def get_recent_post_scorted():
         no_of_post=int(params['n'])
 
         # got number of post, now fetching data using votes_api
+        vote_params = {'n': no_of_post, 'sorted': True, 'summary': True}
         if params.get('community_name') is not None:
-            community_name=str(params['community_name'])
-            vote_resp = requests.get('http://127.0.0.1:{}/get?n={}&community_name={}&sorted=True'.format(VOTE_PORT_NO,no_of_post,community_name))
-
-        else:
-            vote_resp = requests.get('http://127.0.0.1:{}/get?n={}&sorted=True'.format(VOTE_PORT_NO,no_of_post))
+            vote_params['community_name'] = str(params['community_name'])
+        if params.get('cursor'):
+            vote_params['cursor'] = params['cursor']
+        vote_resp = backend_client.vote_backend.get('/get', params=vote_params)
 
+        if vote_resp.status_code == 400:
+            return custom_error("Invalid cursor", 400)
         if vote_resp.status_code != 200:
             # This means something went wrong.
             raise APIError(vote_resp.status_code)
 
-        vote_data=vote_resp.json()
-        vote_scoted_list=[]  # store uuid in scorted form
-        for dic in vote_data:
-            vote_scoted_list.append(dic["uuid"])
-        del vote_data
-        # use these uuids to retrieve posts from post_api
-        data={"uuid": vote_scoted_list}
-        header = {"Content-type": "application/json",}
-        post_resp = requests.post('http://localhost:{}/get_uuids'.format(POST_PORT_NO), data=json.dumps(data), headers=header)
-
-        dict_post_resp = (post_resp.json())
-
-        # generate RSS
-        rss_list=[]
-        for dic in dict_post_resp:
-            date = datetime.fromtimestamp(int(dic['published']))
-
-            item1 = Item(
-                title = dic.get('title',"") or "", # get title form dict or empty string
-                link = dic.get('url',"") or "",
-                description = dic.get('description',"") or "",
-                author = dic.get('username',"") or "",
-                guid = Guid(dic.get('url',"") or ""),
-                categories= dic.get('community_name',"") or "",
-                pubDate = date)
-            rss_list.append(item1)
-
-        feed = Feed(
-            title = "Reddit clone RSS Feed",
-            link = "http://www.example.com/rss",
-            description = "This is project-2 for CPSC-449 an RSS 2.0 feed",
-            language = "en-US",
-            lastBuildDate = datetime.now(),
-            items = rss_list)
-
-        response = make_response(feed.rss())
-        response.headers.set('Content-Type', 'application/rss+xml')
-        return response
+        vote_data=vote_resp.json()  # rows in scorted form
+        dict_post_resp = hydrate_posts(vote_data)
+
+        # generate RSS, linking the next page
+        return rss_response(dict_post_resp, vote_resp.headers.get('X-Next-Cursor'))
     else:
         return custom_error("Enter value of n",404)
 
@@ -184,79 +212,41 @@ def get_recent_post_scorted():
 
 #5) The hot 25 posts to any community, ranked using Reddit’s “hot ranking” algorithm.
 # http://localhost:5000/get_hot?n=25
-def hot(score, date):
-    """
-        Calculate hot score
-        score: Score of a given post (upvote-downvote)
-        date : Time stamp
-    """
-    order = math.log(max(abs(score), 1), 10)
-    sign = 1 if score > 0 else -1 if score < 0 else 0
-    seconds = (date) - 1134028003
-    return round(sign * order + seconds / 45000, 7)
-
-
+#6) The hot 25 posts to a particular community
+# http://localhost:5000/get_hot?n=25&community_name=csuf
+# next pages: http://localhost:5000/get_hot?n=25&cursor=<X-Next-Cursor of the previous page>
 @app.route('/get_hot', methods=["GET"])
+@cached_feed
 def get_hot_post():
     """
-        This route takes ONE arguments
+        This route takes ONE to THREE arguments
         n: Number of Posts (mandatory or required)
+        community_name : Name of community
+        cursor : token of the next page, sent in the X-Next-Cursor header and the atom:link of a feed
 
     """
     params = request.args
     if params.get('n') is not None:
         no_of_post=int(params['n'])
 
-        # got number of post, now fetching data using votes_api
-        vote_resp = requests.get('http://127.0.0.1:{}/get_all'.format(VOTE_PORT_NO))
+        # got number of post, now fetching the hot ranking kept by votes_api
+        vote_params = {'n': no_of_post, 'summary': True}
+        if params.get('community_name') is not None:
+            vote_params['community_name'] = str(params['community_name'])
+        if params.get('cursor'):
+            vote_params['cursor'] = params['cursor']
+        vote_resp = backend_client.vote_backend.get('/hot', params=vote_params)
+        if vote_resp.status_code == 400:
+            return custom_error("Invalid cursor", 400)
         if vote_resp.status_code != 200:
             # This means something went wrong.
             raise APIError(vote_resp.status_code)
 
-        vote_data=vote_resp.json()
-
-        hot_algo_dict={} # dict with key uuid and value hot_score
-        for dic in vote_data:
-            hot_score = hot( float(dic["score"]) , float(dic["published"])) # get hot score using hot method
-            hot_algo_dict[dic["uuid"]]=hot_score
-
-        uuid_list_to_post = sorted(hot_algo_dict, key=hot_algo_dict.get , reverse=True)
-        uuid_list_to_post=uuid_list_to_post[0:no_of_post]
-        del vote_data
-        del hot_algo_dict
-
-        data={"uuid": uuid_list_to_post}
-        header = {"Content-type": "application/json",}
-        post_resp = requests.post('http://localhost:{}/get_uuids'.format(POST_PORT_NO), data=json.dumps(data), headers=header)
-
-        dict_post_resp = (post_resp.json())
-
-        # generate RSS
-        rss_list=[]
-        for dic in dict_post_resp:
-            date = datetime.fromtimestamp(int(dic['published']))
-
-            item1 = Item(
-                title = dic.get('title',"") or "", # get title form dict or empty string
-                link = dic.get('url',"") or "",
-                description = dic.get('description',"") or "",
-                author = dic.get('username',"") or "",
-                guid = Guid(dic.get('url',"") or ""),
-                categories= dic.get('community_name',"") or "",
-                pubDate = date)
-            rss_list.append(item1)
-
-        feed = Feed(
-            title = "Reddit clone RSS Feed",
-            link = "http://www.example.com/rss",
-            description = "This is project-2 for CPSC-449 an RSS 2.0 feed",
-            language = "en-US",
-            lastBuildDate = datetime.now(),
-            items = rss_list)
-
-        response = make_response(feed.rss())
-        response.headers.set('Content-Type', 'application/rss+xml')
-        return response
+        vote_data=vote_resp.json()  # rows in hot ranking order
+        dict_post_resp = hydrate_posts(vote_data)
+
+        # generate RSS, linking the next page
+        return rss_response(dict_post_resp, vote_resp.headers.get('X-Next-Cursor'))
 
     else:
         return custom_error("Enter value of n",404)
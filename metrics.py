@@ -0,0 +1,190 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+"""
+Request and backend latency metrics shared by the services, in the Prometheus text format
+
+init_app() times every request of a Flask app by route and serves the metrics
+on /metrics. Backend round trips are timed by instrument_boto3() (DynamoDB
+calls), instrument_redis() (Redis commands, pipelines and scripts) and by
+backend_client (HTTP calls between the services).
+
+Metrics are kept per process: with several gunicorn workers each worker
+reports its own series. Recording a value takes a lock and a bisect, so the
+middleware can stay on in production.
+"""
+
+# upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    return ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for name, value in zip(names, values))
+
+
+class Counter:
+    """monotonic counter with labels"""
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, value in series:
+            lines.append('{}{{{}}} {}'.format(self.name, format_labels(self.labelnames, labels), value))
+        return lines
+
+
+class Histogram:
+    """latency histogram with labels, buckets are cumulative when exposed"""
+
+    def __init__(self, name, documentation, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.series.get(labels)
+            if entry is None:
+                # counts per bucket (+Inf last), sum
+                entry = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.series.items())
+        for labels, (counts, total) in series:
+            label_text = format_labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, label_text, le, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, label_text, total))
+            lines.append('{}_count{{{}}} {}'.format(self.name, label_text, cumulative))
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'Requests handled, by route and status',
+                   ('service', 'method', 'route', 'status'))
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent handling a request, by route',
+                            ('service', 'method', 'route'))
+BACKEND_LATENCY = Histogram('backend_request_duration_seconds',
+                            'Round trips to a backend (dynamodb, redis, http) and their latency, by operation',
+                            ('backend', 'operation'))
+BACKEND_ERRORS = Counter('backend_errors_total', 'Backend round trips that raised an error',
+                         ('backend', 'operation'))
+METRICS = (REQUESTS, REQUEST_LATENCY, BACKEND_LATENCY, BACKEND_ERRORS)
+
+
+def observe_request(service, method, route, status, seconds):
+    REQUESTS.inc((service, method, route, str(status)))
+    REQUEST_LATENCY.observe((service, method, route), seconds)
+
+
+def observe_backend(backend, operation, seconds):
+    BACKEND_LATENCY.observe((backend, operation), seconds)
+
+
+# time a backend round trip, errors are counted and raised again
+@contextmanager
+def backend_timer(backend, operation):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        BACKEND_ERRORS.inc((backend, operation))
+        raise
+    finally:
+        observe_backend(backend, operation, time.perf_counter() - start)
+
+
+# every metric in the Prometheus text exposition format
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.expose()
+    return '\n'.join(lines) + '\n'
+
+
+# time every request of a Flask app (labelled with the route rule, not the url) and serve /metrics
+def init_app(app, service):
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            observe_request(service, request.method, route, response.status_code, time.perf_counter() - start)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+# time every call of a boto3 client, labelled with the operation name (Query, BatchGetItem...)
+def instrument_boto3(client):
+    backend = client.meta.service_model.service_name
+
+    def start(context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def end(context, model, http_response, **kwargs):
+        if 'metrics_start' in context:
+            observe_backend(backend, model.name, time.perf_counter() - context.pop('metrics_start'))
+            if http_response.status_code >= 400:
+                BACKEND_ERRORS.inc((backend, model.name))
+
+    client.meta.events.register('before-call.' + backend, start)
+    client.meta.events.register('after-call.' + backend, end)
+    return client
+
+
+# time every round trip of a redis client: single commands (scripts run as EVALSHA) and pipelines
+def instrument_redis(client):
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def timed_command(*args, **options):
+        with backend_timer('redis', str(args[0]).upper()):
+            return execute_command(*args, **options)
+
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def timed_execute(*execute_args, **execute_kwargs):
+            with backend_timer('redis', 'PIPELINE'):
+                return execute(*execute_args, **execute_kwargs)
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+    return client
@@ -1,11 +1,25 @@
+import base64
+import csv
 import datetime
+import decimal
+import heapq
+import itertools
 import json
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import click
 from flask import Flask, jsonify, request
 # fix for local dynamodb creating duplicate tables at once because of UTC timezone issues (Reference 1)
 import os
 os.environ["TZ"] = "UTC"
 #
 import boto3
+import requests
+from botocore.exceptions import ClientError, ParamValidationError
+import metrics
+from backend_client import vote_backend
+from post_cache import PostCache
 
 
 ######################
@@ -26,24 +40,71 @@ import boto3
 TABLENAME = 'posts'
 DATABASE_DATA = 'data/posts.json'
 
+# sharded index listing posts of every community by published
+RECENT_INDEX = 'recent-index'
+RECENT_BUCKET_KEY = 'recent_bucket'
+RECENT_SHARDS = 4
+# attributes stored as numbers
+NUMBER_ATTRIBUTES = ('published', RECENT_BUCKET_KEY)
+# attribute types of the keys held by cursors: the community index and the recent index (one per bucket)
+COMMUNITY_CURSOR_KEY = {'uuid': 'S', 'published': 'N', 'community_name': 'S'}
+RECENT_CURSOR_KEY = {RECENT_BUCKET_KEY: 'N', 'published': 'N', 'uuid': 'S'}
+
+# maximum number of keys in a single BatchGetItem request
+BATCH_GET_SIZE = 100
+# retries of UnprocessedKeys/UnprocessedItems, backoff doubles from BATCH_BACKOFF_BASE up to BATCH_BACKOFF_CAP seconds
+BATCH_MAX_RETRIES = 8
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_CAP = 2.0
+
 # flask globals
 app = Flask(__name__)
 
 # flask config variables
 app.config['DEBUG'] = True
+# number of parallel queries used by /get_uuids for uuids without published
+app.config['GET_UUIDS_WORKERS'] = int(os.environ.get('POST_GET_UUIDS_WORKERS', 8))
+# read-through cache of posts by uuid: size, seconds before an entry expires (0: never, an hour in the shared cache),
+# url of a redis database shared by the workers (optional, used instead of the per worker cache)
+app.config['POST_CACHE_SIZE'] = int(os.environ.get('POST_CACHE_SIZE', 4096))
+app.config['POST_CACHE_TTL'] = int(os.environ.get('POST_CACHE_TTL', 60))
+app.config['POST_CACHE_REDIS_URL'] = os.environ.get('POST_CACHE_REDIS_URL')
+
+post_cache = PostCache(max_size=app.config['POST_CACHE_SIZE'],
+                       ttl=app.config['POST_CACHE_TTL'],
+                       redis_url=app.config['POST_CACHE_REDIS_URL'])
+if post_cache.shared is not None:
+    metrics.instrument_redis(post_cache.shared)
+# threads running the queries of /get_uuids, shared by every request
+get_uuids_pool = ThreadPoolExecutor(max_workers=app.config['GET_UUIDS_WORKERS'], thread_name_prefix='get-uuids')
+
+# request latency per route on /metrics
+metrics.init_app(app, 'post_api')
 
 
 # Dynamodb globals
-client = boto3.client('dynamodb', endpoint_url='http://localhost:8000')
+client = metrics.instrument_boto3(boto3.client('dynamodb', endpoint_url='http://localhost:8000'))
 # Using boto3 client (low level api) since it allows more control over queries
 # as compared to boto3 resource (high level api)
 
 
 ######################
 # Helpers
-# remove attribute type from json
+# remove attribute type from json (internal index attributes are dropped)
 def remove_type(x):
-    return [{i: j[i][list(j[i].keys())[0]] for i in list(j.keys())} for j in x]
+    return [{i: j[i][list(j[i].keys())[0]] for i in list(j.keys()) if i != RECENT_BUCKET_KEY} for j in x]
+
+
+# bucket of the recent index a post is written to
+def recent_bucket(uuid):
+    return zlib.crc32(str(uuid).encode()) % RECENT_SHARDS
+
+
+# copy of an item with its recent index bucket set
+def with_recent_bucket(item):
+    item = dict(item)
+    item[RECENT_BUCKET_KEY] = recent_bucket(item.get('uuid'))
+    return item
 
 
 # sort json using a key
@@ -56,11 +117,73 @@ def get_response(status_code, message):
     return {"status_code": str(status_code), "message": str(message)}
 
 
+# opaque continuation token of a DynamoDB key (or of the keys of the recent index buckets)
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(',', ':')).encode()).decode()
+
+
+# key of a continuation token, ValueError if the token is not one returned by /get
+def decode_cursor(token):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError('invalid cursor') from e
+    if not isinstance(key, dict):
+        raise ValueError('invalid cursor')
+    return key
+
+
+# check a typed DynamoDB key ({"uuid": {"S": ...}, "published": {"N": ...}}) against attribute types
+def is_typed_key(key, types):
+    if not isinstance(key, dict) or set(key) != set(types):
+        return False
+    for name, kind in types.items():
+        value = key[name]
+        if not (isinstance(value, dict) and len(value) == 1 and isinstance(value.get(kind), str)):
+            return False
+        if kind == 'N':
+            try:
+                if not decimal.Decimal(value['N']).is_finite():
+                    return False
+            except decimal.InvalidOperation:
+                return False
+    return True
+
+
+# key of a cursor of a community page, ValueError unless it is a community index key of community_name
+def decode_community_cursor(token, community_name):
+    key = decode_cursor(token)
+    if not is_typed_key(key, COMMUNITY_CURSOR_KEY) or key['community_name']['S'] != community_name:
+        raise ValueError('invalid cursor')
+    return key
+
+
+# positions of a cursor of the recent posts, ValueError unless it maps bucket ids to recent index keys
+# of that bucket (or None for a bucket read from its start)
+def decode_recent_cursor(token):
+    key = decode_cursor(token)
+    buckets = {str(bucket) for bucket in range(RECENT_SHARDS)}
+    for bucket, start_key in key.items():
+        if bucket not in buckets:
+            raise ValueError('invalid cursor')
+        if start_key is not None and not (is_typed_key(start_key, RECENT_CURSOR_KEY)
+                                          and start_key[RECENT_BUCKET_KEY]['N'] == bucket):
+            raise ValueError('invalid cursor')
+    return key
+
+
+# DynamoDB rejected the parameters of a request (a start key that does not fit the queried index)
+def is_validation_error(e):
+    return isinstance(e, ParamValidationError) or e.response['Error']['Code'] == 'ValidationException'
+
+
 ######################
 # Dynamodb functions
 # create table using boto3 client
 # Primary Key created on uuid and published
 # Secondary Index created on community_name and published to perform filters on community_name
+# Secondary Index created on recent_bucket and published to list recent posts of all communities,
+# posts are spread over RECENT_SHARDS buckets so no single partition takes every write
 def init_table():
     response = client.create_table(
         TableName=TABLENAME,
@@ -76,6 +199,10 @@ def init_table():
             {
                 'AttributeName': 'community_name',
                 'AttributeType': 'S'
+            },
+            {
+                'AttributeName': RECENT_BUCKET_KEY,
+                'AttributeType': 'N'
             }
         ],
         KeySchema=[
@@ -109,6 +236,26 @@ def init_table():
                     'WriteCapacityUnits': 25
                 }
             },
+            {
+                'IndexName': RECENT_INDEX,
+                'KeySchema': [
+                    {
+                        'AttributeName': RECENT_BUCKET_KEY,
+                        'KeyType': 'HASH',
+                    },
+                    {
+                        'AttributeName': 'published',
+                        'KeyType': 'RANGE'
+                    },
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                },
+                'ProvisionedThroughput': {
+                    'ReadCapacityUnits': 25,
+                    'WriteCapacityUnits': 25
+                }
+            },
         ],
         ProvisionedThroughput={
             'ReadCapacityUnits': 50,
@@ -118,12 +265,38 @@ def init_table():
     print("Create Table operation finished successfully")
 
 
+# per process cache of the required keys of each table (Partition key, Sorting Key, Secondary index Keys)
+# loaded by describe_table the first time a table is written to, and again when a write fails because
+# the table was deleted or created again with other keys (flask init in another process)
+TABLE_KEYS = {}
+
+
+# function to get the required keys of a table from TABLE_KEYS
+# refresh=True describes the table again
+def get_required_keys(table_name, refresh=False):
+    if refresh or table_name not in TABLE_KEYS:
+        table = client.describe_table(TableName=table_name)['Table']
+        key_schema = table['KeySchema']
+        for index in table.get('GlobalSecondaryIndexes', []):
+            key_schema = key_schema + index['KeySchema']
+        TABLE_KEYS[table_name] = list(dict.fromkeys(i['AttributeName'] for i in key_schema))
+    return TABLE_KEYS[table_name]
+
+
+# DynamoDB rejected a write because the table is gone or its keys are not the ones in TABLE_KEYS
+def is_table_keys_error(e):
+    error = e.response['Error']
+    return error['Code'] == 'ResourceNotFoundException' or \
+        (error['Code'] == 'ValidationException' and 'key' in error.get('Message', '').lower())
+
+
 # function to put a single item in dynamodb
-def put_item_ddb(table_name, item_input):
+# overwrite=False makes the put fail with ConditionalCheckFailedException if the key already exists
+# a put failing on the keys of the table is retried once with the keys described again
+def put_item_ddb(table_name, item_input, overwrite=True, refresh=False):
+    item_input = with_recent_bucket(item_input)
     # ensure primary keys are included as args
-    req_keys = client.describe_table(TableName=table_name)['Table']['KeySchema'] + \
-               [i['KeySchema'] for i in client.describe_table(TableName=table_name)['Table']['GlobalSecondaryIndexes']][0]
-    req_keys = [i['AttributeName'] for i in req_keys]
+    req_keys = get_required_keys(table_name, refresh)
     for i in req_keys:
         if i not in list(item_input.keys()):
             raise ValueError(f"Required key '{i}' not included in args")
@@ -133,23 +306,32 @@ def put_item_ddb(table_name, item_input):
     item = {}
     for i in list(item_input.keys()):
         if i != 'table_name':
-            if i == 'published':
+            if i in NUMBER_ATTRIBUTES:
                 item[i] = {"N": str(item_input.get(i))}
             else:
                 item[i] = {"S": item_input.get(i)}
     #
-    client.put_item(TableName=table_name, Item=item)
+    kwargs = dict(TableName=table_name, Item=item)
+    if not overwrite:
+        kwargs['ConditionExpression'] = 'attribute_not_exists(#uuid_key)'
+        kwargs['ExpressionAttributeNames'] = {'#uuid_key': 'uuid'}
+    try:
+        client.put_item(**kwargs)
+    except ClientError as e:
+        if refresh or not is_table_keys_error(e):
+            raise
+        put_item_ddb(table_name, item_input, overwrite, refresh=True)
 
 
 # function to put items in batch in dynamodb to a single table
-def put_item_batch(table_name, items):
-    # get required keys (Partition key, Sorting Key, Secondary index Key)
-    req_keys = client.describe_table(TableName=table_name)['Table']['KeySchema'] + \
-           [i['KeySchema'] for i in client.describe_table(TableName=table_name)['Table']['GlobalSecondaryIndexes']][0]
-    req_keys = [i['AttributeName'] for i in req_keys]
+# a batch failing on the keys of the table is written again once with the keys described again
+def put_item_batch(table_name, items, refresh=False):
+    # get required keys (Partition key, Sorting Key, Secondary index Keys)
+    req_keys = get_required_keys(table_name, refresh)
 
     putreq_list = []
     for item in items:
+        item = with_recent_bucket(item)
         # ensure required keys are included as args
         for i in req_keys:
             if i not in list(item.keys()):
@@ -161,7 +343,7 @@ def put_item_batch(table_name, items):
         it = {}
         for i in list(item.keys()):
             if i != 'table_name':
-                if i == 'published':
+                if i in NUMBER_ATTRIBUTES:
                     it[i] = {"N": str(item[i])}
                 else:
                     it[i] = {"S": item[i]}
@@ -171,8 +353,22 @@ def put_item_batch(table_name, items):
         putreq_list.append(putreq)
     req_items = {table_name: putreq_list}
 
-    # write in batch
-    response = client.batch_write_item(RequestItems=req_items)
+    # write in batch, UnprocessedItems are retried with exponential backoff
+    attempt = 0
+    while req_items:
+        try:
+            response = client.batch_write_item(RequestItems=req_items)
+        except ClientError as e:
+            if refresh or not is_table_keys_error(e):
+                raise
+            return put_item_batch(table_name, items, refresh=True)
+        req_items = response.get('UnprocessedItems') or {}
+        if req_items:
+            if attempt >= BATCH_MAX_RETRIES:
+                raise RuntimeError(f"{len(req_items[table_name])} items still unprocessed after {attempt} retries")
+            time.sleep(min(BATCH_BACKOFF_CAP, BATCH_BACKOFF_BASE * 2 ** attempt))
+            attempt += 1
+    return len(putreq_list)
 
 
 # function to populate database with posts in posts.json
@@ -183,54 +379,270 @@ def init_posts():
         data = json.loads(f.read())['data']
 
     for i in data:
-        item_dict = i.copy()
-        # if published key is not present, default it to right now since it is a Sorting Key
-        item_dict.setdefault('published', str(datetime.datetime.utcnow().isoformat()))
-        #
-        # delete item_dict with values as empty strings or None
-        for j in list(item_dict.keys()):
-            if item_dict[j] is None or item_dict[j] == "":
-                _ = item_dict.pop(j, None)
-        #
+        item_dict = clean_item(i)
         # write item to db
         put_item_ddb(table_name=TABLENAME, item_input=item_dict)
     print("Create Posts Operation finished successfully")
 
 
-# function to populate database with posts using batch_write in posts.json
-# this function is comparably faster than init_posts()
-def init_posts_batch():
-    # read initial posts values from DATABASE_DATA file
-    with open(DATABASE_DATA, 'rb') as f:
-        data = json.loads(f.read())['data']
+# clean a post read from a data file before writing it to db
+def clean_item(i):
+    item_dict = i.copy()
+    # if published key is not present, default it to right now since it is a Sorting Key
+    item_dict.setdefault('published', str(datetime.datetime.utcnow().isoformat()))
     #
+    # delete item_dict with values as empty strings or None
+    for j in list(item_dict.keys()):
+        if item_dict[j] is None or item_dict[j] == "":
+            _ = item_dict.pop(j, None)
+    return item_dict
+
+
+# generator over the records of the "data" array of a json data file (pandas orient='table')
+# the file is decoded chunk by chunk, only one chunk and one record are held in memory
+def iter_json_records(path, chunk_size=1 << 16):
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        # skip to the opening bracket of the data array
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            pos = buffer.find('"data"')
+            if pos != -1 and buffer.find('[', pos) != -1:
+                buffer = buffer[buffer.find('[', pos) + 1:]
+                break
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield record
+            buffer = buffer[end:]
+
+
+# generator over the records of a csv data file (the unnamed pandas index column is dropped)
+def iter_csv_records(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            row.pop('', None)
+            yield row
+
+
+# group an iterable in lists of batch_size items
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+# function to populate database with posts from a json or csv data file
+# records are streamed from the file and batches of batch_size items are written by a pool of
+# worker threads using batch_write_item (at most 2 batches per worker are queued at a time)
+# batch_size cannot exceed 25 (gives an error)
+def load_posts(path=DATABASE_DATA, workers=8, batch_size=25, report_every=500):
+    if path.endswith('.csv'):
+        records = iter_csv_records(path)
+    else:
+        records = iter_json_records(path)
     count = 0
-    # batch_size cannot exceed 25 (gives an error)
-    batch_size = 25     # decrease this value if fn gives Throughput error
+    reported = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for batch in iter_batches(map(clean_item, records), batch_size):
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                count += sum(future.result() for future in done)
+            pending.add(executor.submit(put_item_batch, TABLENAME, batch))
+            if count - reported >= report_every:
+                reported = count
+                print(f"{count} items written to db ({count / (time.perf_counter() - start):.0f} items/s)")
+        count += sum(future.result() for future in pending)
+    elapsed = time.perf_counter() - start
+    print(f"{count} items written to db in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} items/s)")
+    return count
+
+
+
+# format a number the way DynamoDB stores it (1588089788.0 -> 1588089788)
+# raises ValueError if x is not a finite number
+def number_value(x):
+    try:
+        value = decimal.Decimal(str(x))
+    except decimal.InvalidOperation:
+        raise ValueError(f"invalid number {x!r}")
+    if isinstance(x, bool) or not value.is_finite():
+        raise ValueError(f"invalid number {x!r}")
+    return format(value.normalize(), 'f')
+
+
+# function to query all items of a uuid (only the HASH key is known, Reference 2)
+def query_uuid(uuid):
+    response = client.query(
+        TableName=TABLENAME,
+        KeyConditionExpression='#uuid_key = :uuid',
+        ExpressionAttributeValues={
+            ':uuid': {'S': f'{str(uuid)}'}
+        },
+        ExpressionAttributeNames={
+            '#uuid_key': 'uuid',
+        }
+    )
+    return response.get('Items', [])
+
+
+# function to check whether any post has this uuid, whatever its published (one Query of at most one key)
+def uuid_exists(uuid):
+    response = client.query(
+        TableName=TABLENAME,
+        KeyConditionExpression='#uuid_key = :uuid',
+        ExpressionAttributeValues={
+            ':uuid': {'S': f'{str(uuid)}'}
+        },
+        ExpressionAttributeNames={
+            '#uuid_key': 'uuid',
+        },
+        ProjectionExpression='#uuid_key',
+        Limit=1,
+    )
+    return len(response.get('Items', [])) > 0
+
+
+# function to get items with their full primary key (uuid, published) using BatchGetItem
+# keys are sent BATCH_GET_SIZE at a time and UnprocessedKeys are retried with exponential backoff
+# returns a dict of uuid -> item for the items found
+def batch_get_items(keys):
+    found = {}
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request_items = {
+            TABLENAME: {
+                'Keys': [{'uuid': {'S': uuid}, 'published': {'N': number_value(published)}}
+                         for uuid, published in keys[start:start + BATCH_GET_SIZE]]
+            }
+        }
+        attempt = 0
+        while request_items:
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response['Responses'].get(TABLENAME, []):
+                found[item['uuid']['S']] = item
+            request_items = response.get('UnprocessedKeys') or {}
+            if request_items:
+                if attempt >= BATCH_MAX_RETRIES:
+                    break
+                time.sleep(min(BATCH_BACKOFF_CAP, BATCH_BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+    return found
+
+
+# function to retrieve the items of a list of (uuid, published) keys, published can be None
+# uuids found in post_cache (one round trip for all of them) are not read again, full keys are read with BatchGetItem,
+# the other uuids (and full keys BatchGetItem did not find) are queried in parallel on get_uuids_pool
+# use_cache=False neither reads nor fills post_cache (bulk reads that would evict the hot posts)
+# returns (items in the order of keys, list of uuids not found)
+def get_items_by_uuid(keys, use_cache=True):
+    results = post_cache.get_many(uuid for uuid, _ in keys) if use_cache else {}
+    cached = set(results)
+
+    full_keys = list({uuid: (uuid, published) for uuid, published in keys
+                      if published is not None and uuid not in results}.values())
+    for uuid, item in batch_get_items(full_keys).items():
+        results[uuid] = [item]
+
+    to_query = list(dict.fromkeys(uuid for uuid, _ in keys if uuid not in results))
+    if to_query:
+        for uuid, items in zip(to_query, get_uuids_pool.map(query_uuid, to_query)):
+            results[uuid] = items
+
+    if use_cache:
+        post_cache.put_many({uuid: items for uuid, items in results.items() if uuid not in cached})
+
+    items = []
+    missing = []
+    for uuid, _ in keys:
+        if results.get(uuid):
+            items += results[uuid]
+        else:
+            missing.append(uuid)
+    return items, missing
+
+
+# generator over the items of one recent index bucket, ordered by published
+# pages of page_size items are queried lazily as the generator is consumed
+def query_recent_bucket(bucket, page_size, descending, start_key=None):
+    kwargs = dict(
+        TableName=TABLENAME,
+        IndexName=RECENT_INDEX,
+        KeyConditionExpression='#bucket = :bucket',
+        ExpressionAttributeValues={
+            ':bucket': {'N': str(bucket)}
+        },
+        ExpressionAttributeNames={
+            '#bucket': RECENT_BUCKET_KEY,
+        },
+        ScanIndexForward=not descending,
+        Limit=page_size,
+    )
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
     while True:
-        if count >= len(data):
-            break
-        if count != 0 and count % 500 == 0:
-            print(f"{count} items written to db")
-        items = data[count:count+batch_size]
-        batch = []
-        for i in items:
-            item_dict = i.copy()
-            item_dict['table_name'] = TABLENAME
-            # if published key is not present, default it to right now since it is a Sorting Key
-            item_dict.setdefault('published', str(datetime.datetime.utcnow().isoformat()))
-            #
-            # delete item_dict with values as empty strings or None
-            for j in list(item_dict.keys()):
-                if item_dict[j] is None or item_dict[j] == "":
-                    _ = item_dict.pop(j, None)
-            batch.append(item_dict)
-            #
+        response = client.query(**kwargs)
+        yield from response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+# key of an item in the recent index (index keys and table keys), used to resume a bucket after it
+def recent_key(item):
+    return {k: item[k] for k in (RECENT_BUCKET_KEY, 'published', 'uuid')}
+
+
+# function to get the n most recent (descending) or oldest posts of every community
+# the buckets are merged lazily, so about n items are read whatever the table size
+# cursor maps each bucket to the key of the last item returned from it (None: start of the bucket),
+# the cursor of the next page is returned with the items (None when there are no more posts)
+def get_recent_items(n, descending=True, cursor=None):
+    if n <= 0:
+        return [], None
+    positions = {bucket: None for bucket in range(RECENT_SHARDS)}
+    if cursor is not None:
+        positions.update({int(bucket): key for bucket, key in cursor.items()})
+    page_size = n // RECENT_SHARDS + 1
+    buckets = [query_recent_bucket(bucket, page_size, descending, start_key)
+               for bucket, start_key in positions.items()]
+    merged = heapq.merge(*buckets, key=lambda x: decimal.Decimal(x['published']['N']), reverse=descending)
+    items = list(itertools.islice(merged, n))
+    if len(items) < n:
+        return items, None
+    for item in items:
+        positions[int(item[RECENT_BUCKET_KEY]['N'])] = recent_key(item)
+    return items, {str(bucket): key for bucket, key in positions.items()}
 
-        put_item_batch(table_name=TABLENAME, items=batch)
-        # increment counter
-        count += batch_size
-    print("Batch Create Posts Operation finished successfully")
+
+# function to keep the feed summary of a post stored by vote_api in sync, and to delete the votes of a deleted post
+# a failure is logged, it does not fail the post write (the front server falls back to /get_uuids)
+def sync_summary(method, path, **kwargs):
+    try:
+        response = getattr(vote_backend, method)(path, **kwargs)
+        if response.status_code != 200:
+            app.logger.warning(f"vote_api {method} {path} returned {response.status_code}")
+    except requests.RequestException as e:
+        app.logger.warning(f"vote_api {method} {path} failed: {e}")
 
 
 def print_table_names():
@@ -243,7 +655,9 @@ def print_table_names():
 # $flask init
 # use flask init to create posts table and fill it with data
 @app.cli.command('init')
-def init_db():
+@click.option('--data', 'data_path', default=DATABASE_DATA, show_default=True, help='posts data file (.json or .csv)')
+@click.option('--workers', default=8, show_default=True, help='number of parallel batch writers')
+def init_db(data_path, workers):
     table_names = client.list_tables()['TableNames']
     if len(client.list_tables()['TableNames']) > 0:
         for i in table_names:
@@ -254,7 +668,7 @@ def init_db():
     init_table()
     print('*'*30)
     print(f"Posts Batch writing Operation started")
-    init_posts_batch()
+    load_posts(path=data_path, workers=workers)
     print('*' * 30)
 
 
@@ -279,27 +693,26 @@ def get_post_filtered():
             community_name : (community_name as string)         Name of community
             uuid : (uuid as string):                            use uuid filter for a single post retrieval
             recent: (True, False (default)):                    to return posts sorted as most recent to oldest
+            cursor : (string)                                   X-Next-Cursor header of the previous page
             if params contains uuid, all other params are ignored except published
+            when more posts may follow, the token of the next page is sent in the X-Next-Cursor header
     """
     params = request.args
+    next_cursor = None
     if params.get('uuid') is not None:
         # got uuid, return a single post (Ignore all other params)
-        kwargs = dict(
-            TableName=TABLENAME,
-            KeyConditionExpression='#uuid_key = :uuid',
-            ExpressionAttributeValues={
-                ':uuid': {'S': f'{str(params["uuid"])}'}
-            },
-            ExpressionAttributeNames={
-                '#uuid_key': 'uuid',
-            }
-        )
-        response = client.query(**kwargs)
-        if 'Items' in response:
-            response = response['Items']
-        else:
-            response = []
+        response = post_cache.get_or_load(str(params['uuid']), query_uuid)
     else:
+        # the cursor must be one returned for the same listing
+        cursor = None
+        if params.get('cursor'):
+            try:
+                if params.get('community_name'):
+                    cursor = decode_community_cursor(params['cursor'], params['community_name'])
+                else:
+                    cursor = decode_recent_cursor(params['cursor'])
+            except ValueError:
+                return jsonify(get_response(status_code=400, message='invalid cursor')), 400
         if params.get('community_name'):
             # got community_name, filter posts with community_name
             kwargs = dict(
@@ -322,62 +735,63 @@ def get_post_filtered():
             #
             if params.get('recent') is not None:
                 kwargs['ScanIndexForward'] = not params['recent']
+            # resume after the last post of the previous page
+            if cursor is not None:
+                kwargs['ExclusiveStartKey'] = cursor
             #
-            response = client.query(**kwargs)
+            try:
+                response = client.query(**kwargs)
+            except (ParamValidationError, ClientError) as e:
+                if not is_validation_error(e):
+                    raise
+                # a start key DynamoDB rejects
+                return jsonify(get_response(status_code=400, message='invalid cursor')), 400
+            next_cursor = response.get('LastEvaluatedKey')
             response = response['Items']
         else:
-            # no community name, return all results with limit
-            # Scan table and sort it
-            result = []
-            response = client.scan(TableName='posts')
-            for i in response['Items']:
-                result.append(i)
-            while 'LastEvaluatedKey' in response:
-                response = client.scan(TableName='posts', ExclusiveStartKey=response['LastEvaluatedKey'])
-                for i in response["Items"]:
-                    result.append(i)
-
-            # sort on published
-            if params.get('recent') is not None:
-                result = sorted(result, key=lambda x: x['published']['N'], reverse=True)
-
-            # return n posts
+            # no community name, merge the most recent (or oldest) n posts of the recent index shards
             if params.get('n'):
                 n = int(params['n'])
             else:
                 n = 100  # default
-            result = result[:n]
-
-            response = result
+            try:
+                response, next_cursor = get_recent_items(n, descending=params.get('recent') is not None, cursor=cursor)
+            except (ParamValidationError, ClientError) as e:
+                if not is_validation_error(e):
+                    raise
+                # a start key DynamoDB rejects
+                return jsonify(get_response(status_code=400, message='invalid cursor')), 400
     response = remove_type(response)
-    return jsonify(response), 200
+    headers = {'X-Next-Cursor': encode_cursor(next_cursor)} if next_cursor else {}
+    return jsonify(response), 200, headers
 
 
 # get post filtered from a list
+# the uuid list can hold uuid strings or {"uuid": ..., "published": ...} objects,
+# posts are returned in the order of the list
+# with "report_missing": true the response is {"items": [...], "missing": [uuids not found]}
+# with "cache": false the posts are read from DynamoDB and not cached (used by the vote_api sweeper)
 @app.route('/get_uuids', methods=['POST'])
 def get_post_uuids():
     params = request.json
-    print(params)
     uuids = params.get('uuid')
     if uuids is None:
         return jsonify(get_response(status_code=404, message='list of uuids not found'))
-    json_ = []
+    keys = []
     for i in uuids:
-        kwargs = dict(
-            TableName=TABLENAME,
-            KeyConditionExpression='#uuid_key = :uuid',
-            ExpressionAttributeValues={
-                ':uuid': {'S': f'{str(i)}'}
-            },
-            ExpressionAttributeNames={
-                '#uuid_key': 'uuid',
-            }
-        )
-        response = client.query(**kwargs)
-        if 'Items' in response:
-            response = response['Items']
-            response = remove_type(response)
-            json_ += response
+        if isinstance(i, dict) and i.get('published') is not None:
+            try:
+                keys.append((str(i.get('uuid')), number_value(i['published'])))
+            except ValueError:
+                return jsonify(get_response(status_code=400, message='invalid published')), 400
+        elif isinstance(i, dict):
+            keys.append((str(i.get('uuid')), None))
+        else:
+            keys.append((str(i), None))
+    items, missing = get_items_by_uuid(keys, use_cache=params.get('cache', True) is not False)
+    json_ = remove_type(items)
+    if params.get('report_missing'):
+        return jsonify({'items': json_, 'missing': missing})
     return jsonify(json_)
 
 
@@ -387,36 +801,25 @@ def get_post_uuids():
 def create_post():
     params = request.get_json()
 
-    # check if uuid exists
-    if params.get('uuid') is not None:
-        get_kwargs = dict(
-            TableName=TABLENAME,
-            KeyConditionExpression='#uuid_key = :uuid',
-            ExpressionAttributeValues={
-                ':uuid': {'S': f'{str(params.get("uuid"))}'}
-            },
-            ExpressionAttributeNames={
-                '#uuid_key': 'uuid',
-            }
-        )
-        response = client.query(**get_kwargs)
-        if 'Items' in response:
-            response = response['Items']
-        else:
-            response = []
-        if len(response) > 0:
-            return jsonify(status_code=409, message='uuid already exists')
-    else:
+    if params.get('uuid') is None:
         return jsonify(get_response(status_code=404, message='uuid attribute not found'))
 
-    # put item in db
+    # uuids are unique across published values (vote_api, the post cache and the summaries key on uuid alone)
+    if uuid_exists(params['uuid']):
+        return jsonify(status_code=409, message='uuid already exists')
+
+    # put item in db, the conditional put also rejects a concurrent create of the same (uuid, published)
     item_dict = {}
     for i in list(params.keys()):
         item_dict[i] = params[i]
     try:
-        put_item_ddb(table_name=TABLENAME, item_input=item_dict)
+        put_item_ddb(table_name=TABLENAME, item_input=item_dict, overwrite=False)
+    except client.exceptions.ConditionalCheckFailedException:
+        return jsonify(status_code=409, message='uuid already exists')
     except:
         return jsonify(get_response(status_code=404, message="Dynamodb put_item query failed"))
+    post_cache.invalidate(str(params['uuid']))
+    sync_summary('post', '/summary', json=item_dict)
     return jsonify(get_response(status_code=201, message="Post Created"))
 
 
@@ -446,6 +849,8 @@ def update_post():
     kwargs['ExpressionAttributeValues'] = exp_values
     try:
         response = client.update_item(**kwargs)
+        post_cache.invalidate(str(params['uuid']))
+        sync_summary('post', '/summary', json=params)
         return jsonify(get_response(status_code=201, message='Post updated'))
     except:
         return jsonify(get_response(status_code=404, message='DynamoDB update operation failed'))
@@ -463,6 +868,9 @@ def delete_post():
                 'published': {'N': f'{str(params["published"])}'}
             }
         )
+        post_cache.invalidate(str(params['uuid']))
+        # the votes, indexes and summary of the post go with it (a missed call is reclaimed by the vote_api sweeper)
+        sync_summary('delete', '/delete_vote', params={'uuid': params['uuid']})
         return jsonify(get_response(status_code=200, message='Post deleted'))
     else:
         return jsonify(get_response(status_code=404, message='delete post requires uuid and published attributes'))
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis is only needed for the shared tier
+    redis = None
+
+"""
+Read-through cache of post items for post_api
+
+Items are kept per uuid with a TTL, either in a bounded in-process LRU or,
+when redis_url is set, in a Redis tier shared by every gunicorn worker. The
+shared tier is authoritative: the local LRU is not used with it, so the
+invalidate() called by update and delete on one worker is seen by all of them.
+Without it each worker caches on its own and only the worker that handled a
+write drops its entry, the TTL bounds how long the others serve the old post.
+A read racing a write can store the items read before the write, the TTL also
+bounds that. Shared entries always expire (after SHARED_TTL seconds when ttl is 0),
+as max_size does not bound the Redis tier.
+"""
+
+
+class PostCache:
+    """LRU read-through cache of the DynamoDB items of a uuid"""
+
+    # seconds before a shared entry expires when no ttl is given
+    SHARED_TTL = 3600
+
+    def __init__(self, max_size=1024, ttl=None, redis_url=None, redis_prefix='postcache:'):
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self.shared_ttl = self.ttl or self.SHARED_TTL
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.redis_prefix = redis_prefix
+        self.shared = None
+        if redis_url:
+            if redis is None:
+                raise RuntimeError("the redis package is required for the shared post cache")
+            self.shared = redis.StrictRedis.from_url(redis_url, decode_responses=True)
+
+    def _get_local(self, uuid):
+        with self.lock:
+            entry = self.entries.get(uuid)
+            if entry is None:
+                return None
+            items, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[uuid]
+                return None
+            self.entries.move_to_end(uuid)
+            return items
+
+    def _put_local(self, uuid, items):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.entries[uuid] = (items, expires)
+            self.entries.move_to_end(uuid)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    # cached items of a uuid or None
+    def get(self, uuid):
+        return self.get_many([uuid]).get(uuid)
+
+    # cached items of many uuids, {uuid: items} for the uuids found
+    # the shared tier is read with one MGET
+    def get_many(self, uuids):
+        uuids = list(dict.fromkeys(uuids))
+        if not uuids:
+            return {}
+        if self.shared is not None:
+            values = self.shared.mget([self.redis_prefix + uuid for uuid in uuids])
+            found = {uuid: json.loads(value) for uuid, value in zip(uuids, values) if value is not None}
+        else:
+            found = {}
+            for uuid in uuids:
+                items = self._get_local(uuid)
+                if items is not None:
+                    found[uuid] = items
+        with self.lock:
+            if self.shared is not None:
+                self.shared_hits += len(found)
+            self.hits += len(found)
+            self.misses += len(uuids) - len(found)
+        return found
+
+    # store the items of a uuid (empty results are not cached)
+    def put(self, uuid, items):
+        self.put_many({uuid: items})
+
+    # store the items of many uuids ({uuid: items}), the shared tier is written in one pipelined round trip
+    def put_many(self, items_by_uuid):
+        items_by_uuid = {uuid: items for uuid, items in items_by_uuid.items() if items}
+        if not items_by_uuid:
+            return
+        if self.shared is not None:
+            pipe = self.shared.pipeline(transaction=False)
+            for uuid, items in items_by_uuid.items():
+                pipe.set(self.redis_prefix + uuid, json.dumps(items), ex=self.shared_ttl)
+            pipe.execute()
+        else:
+            for uuid, items in items_by_uuid.items():
+                self._put_local(uuid, items)
+
+    # items of a uuid, load(uuid) is called on a miss and its result cached
+    def get_or_load(self, uuid, load):
+        items = self.get(uuid)
+        if items is None:
+            items = load(uuid)
+            self.put(uuid, items)
+        return items
+
+    def invalidate(self, uuid):
+        with self.lock:
+            self.entries.pop(uuid, None)
+        if self.shared is not None:
+            self.shared.delete(self.redis_prefix + uuid)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'shared_hits': self.shared_hits}
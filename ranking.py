@@ -0,0 +1,57 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed by the batch functions
+    np = None
+
+"""
+Ranking functions shared by the front server and the voting microservice
+"""
+
+# epoch used by Reddit's hot ranking (2005-12-08)
+HOT_EPOCH = 1134028003
+# seconds for the time component of the hot score to grow by one, 12.5 hours
+HOT_DECAY = 45000
+
+
+def hot(score, date):
+    """
+        Calculate hot score
+        score: Score of a given post (upvote-downvote)
+        date : Time stamp
+    """
+    order = math.log(max(abs(score), 1), 10)
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = (date) - HOT_EPOCH
+    return round(sign * order + seconds / HOT_DECAY, 7)
+
+
+def hot_scores(scores, dates):
+    """
+        Calculate hot scores of many posts at once (same formula and rounding as hot)
+        scores: array of scores (upvote-downvote)
+        dates : array of time stamps
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    dates = np.asarray(dates, dtype=np.float64)
+    order = np.log(np.maximum(np.abs(scores), 1)) / math.log(10)
+    sign = np.sign(scores)
+    seconds = dates - HOT_EPOCH
+    return np.round(sign * order + seconds / HOT_DECAY, 7)
+
+
+def top_hot(scores, dates, k):
+    """
+        Indices of the k hottest posts, hottest first
+        the k candidates are selected with argpartition, only they are sorted
+    """
+    hot_ = hot_scores(scores, dates)
+    k = min(k, len(hot_))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(hot_):
+        candidates = np.argpartition(-hot_, k - 1)[:k]
+    else:
+        candidates = np.arange(len(hot_))
+    return candidates[np.argsort(-hot_[candidates], kind='stable')]
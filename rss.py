@@ -0,0 +1,78 @@
+import re
+from email.utils import formatdate
+from xml.sax.saxutils import escape as escape_xml, quoteattr
+
+"""
+Streaming RSS 2.0 writer for the feeds of the front server
+
+rss_chunks() turns the post rows returned by post_api into RSS text one item
+at a time, so a feed can be sent as a chunked response without building the
+whole document in memory.
+"""
+
+FEED_TITLE = "Reddit clone RSS Feed"
+FEED_LINK = "http://www.example.com/rss"
+FEED_DESCRIPTION = "This is project-2 for CPSC-449 an RSS 2.0 feed"
+FEED_LANGUAGE = "en-US"
+ATOM_NAMESPACE = "http://www.w3.org/2005/Atom"
+
+
+# characters that are not allowed anywhere in an XML 1.0 document
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+# escape &, < and > and drop characters XML cannot carry
+def escape(value):
+    return escape_xml(INVALID_XML_CHARS.sub('', value))
+
+
+# RFC 822 date of a unix timestamp, as required by RSS
+def rss_date(timestamp):
+    return formatdate(int(float(timestamp)), usegmt=True)
+
+
+def element(name, value):
+    return "<{0}>{1}</{0}>".format(name, escape(str(value)))
+
+
+def rss_item(post):
+    url = post.get('url', "") or ""
+    parts = ["<item>",
+             element("title", post.get('title', "") or ""),
+             element("link", url),
+             element("description", post.get('description', "") or ""),
+             element("author", post.get('username', "") or ""),
+             element("pubDate", rss_date(post['published']))]
+    if post.get('community_name'):
+        parts.append(element("category", post['community_name']))
+    parts.append('<guid isPermaLink="true">{}</guid>'.format(escape(url)))
+    parts.append("</item>")
+    return "".join(parts)
+
+
+# generator of the text of a feed
+# lastBuildDate is the publication date of the newest post, so the same posts always render
+# the same document (and the same ETag)
+# next_url is the url of the next page of the feed, sent as an atom:link rel="next" (RFC 5005)
+def rss_chunks(posts, next_url=None):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    if next_url:
+        yield '<rss version="2.0" xmlns:atom={}><channel>'.format(quoteattr(ATOM_NAMESPACE))
+    else:
+        yield '<rss version="2.0"><channel>'
+    yield element("title", FEED_TITLE)
+    yield element("link", FEED_LINK)
+    yield element("description", FEED_DESCRIPTION)
+    yield element("language", FEED_LANGUAGE)
+    if next_url:
+        yield '<atom:link href={} rel="next"/>'.format(quoteattr(next_url))
+    if posts:
+        yield element("lastBuildDate", rss_date(max(float(post['published']) for post in posts)))
+    for post in posts:
+        yield rss_item(post)
+    yield '</channel></rss>'
+
+
+# whole feed as one string
+def render_rss(posts, next_url=None):
+    return "".join(rss_chunks(posts, next_url))
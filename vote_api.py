@@ -1,15 +1,31 @@
+import atexit
 import datetime
+import hashlib
+import heapq
+import itertools
+import math
+import os
+import time
+import click
 import redis
+import metrics
+from backend_client import post_backend
+from ranking import hot, HOT_EPOCH, HOT_DECAY
+from vote_coalescer import VoteCoalescer
 from flask import Flask, jsonify, request
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 """
 ---------------------Dev 2 - Porting to the voting microservice to Redis---------------------------
-1. Upvote a post
-curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"QWERTYMXW3TICIOQBCND86Z0D3"}' http://localhost:5200/upvotes
+0. Load data/votes.json into redis (skipped if already loaded)
+FLASK_APP=vote_api.py flask init
+
+1. Upvote a post (one vote per username and post, voting again the other way changes the vote)
+curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"QWERTYMXW3TICIOQBCND86Z0D3", "username":"some_guy_or_gal"}' http://localhost:5200/upvotes
 
 2. Downvote a post
-curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"QWERTYMXW3TICIOQBCND86Z0D3"}' http://localhost:5200/downvotes
+curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"QWERTYMXW3TICIOQBCND86Z0D3", "username":"some_guy_or_gal"}' http://localhost:5200/downvotes
 
 3. Report the number of scores (downvotes-upvotes) for a post:
 curl -i -X GET 'http://localhost:5200/get?uuid=HARLIKMXW3TICIOQBCND86Z0D3'
@@ -23,54 +39,364 @@ curl -i -X POST -H 'Content-Type:application/json' -d '{"n":3, "sorted":"True",
 6. Create operation
 curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"HARLIKMXW3TICIOQBCND86Z0D3", "community_name":"csuf", "score":"0", "published":"15058265108"}' http://localhost:5200/create_vote
 
-7. Delete operation
+7. Delete operation (removes the post from every index, post_api calls it when a post is deleted)
 curl -i -X DELETE 'http://localhost:5200/delete_vote?uuid=CAEPJIPK49FSWZ4K02JBAFYJB'
+Index entries left behind by deleted posts are reclaimed by
+FLASK_APP=vote_api.py flask sweep --check-posts --interval 300
 
 8. Retrieve all operations
 curl -i -X GET 'http://localhost:5200/get_all'
 
+9. List the n hottest posts to any community or to a particular community:
+curl -i -X GET 'http://localhost:5200/hot?n=25&community_name=csuf'
+
+10. Store the feed summary of a post (called by post_api), rows of /get and /hot include it with summary=True
+curl -i -X POST -H 'Content-Type:application/json' -d '{"uuid":"HARLIKMXW3TICIOQBCND86Z0D3", "title":"Test post", "url":"http://example.com", "username":"some_guy_or_gal"}' http://localhost:5200/summary
+curl -i -X GET 'http://localhost:5200/hot?n=25&summary=True'
+
+11. Page through a ranking (offset/limit, or the X-Next-Cursor header of the previous page) and rank a post
+curl -i -X GET 'http://localhost:5200/get?limit=25&offset=25&sorted=True'
+curl -i -X GET 'http://localhost:5200/get?n=25&sorted=True&cursor=<X-Next-Cursor>'
+curl -i -X GET 'http://localhost:5200/rank?uuid=HARLIKMXW3TICIOQBCND86Z0D3&community_name=csuf&by=hot'
+
+12. Spread the votes over several redis servers (shards), posts are placed by a hash of their uuid
+VOTE_REDIS_URLS=redis://localhost:6379/1,redis://localhost:6380/1 FLASK_APP=vote_api.py flask init --force
+
 """
 
+# GLOBALS
+DATABASE_DATA = 'data/votes.json'
+# posts data file, the feed summaries of the posts are loaded from it
+POSTS_DATA = 'data/posts.json'
+# key holding the version of the data file loaded by flask init
+LOADED_KEY = 'votes:loaded'
+# hash of the posts the sweeper found missing from post_api, uuid -> unix time they were first found missing
+# (one per shard, for the posts of that shard)
+SWEEP_MISSING_KEY = 'sweep:missing'
+# a batch of at least this many posts all missing from post_api aborts the sweep (table reloading or empty)
+SWEEP_ABORT_MIN_BATCH = 10
+
 #flask globals
 app = Flask(__name__)
 #flask config variables
 app.config['DEBUG'] = True
+# redis databases holding the votes (comma separated redis URLs), every post lives on one of them (its shard),
+# chosen by a hash of its uuid; rankings are read from every shard and merged
+app.config['VOTE_REDIS_URLS'] = os.environ.get('VOTE_REDIS_URLS', 'redis://localhost:6379/1').split(',')
+# number of uuids fetched per pipelined round trip when hydrating vote rows
+app.config['REDIS_BATCH_SIZE'] = int(os.environ.get('VOTE_REDIS_BATCH_SIZE', 500))
+# optional write-behind coalescing of votes: the votes of a uuid are summed for
+# VOTE_COALESCE_WINDOW_MS milliseconds and flushed in one pipelined batch (off by default)
+app.config['VOTE_COALESCE'] = os.environ.get('VOTE_COALESCE', '0') == '1'
+app.config['VOTE_COALESCE_WINDOW_MS'] = int(os.environ.get('VOTE_COALESCE_WINDOW_MS', 50))
+# uuids waiting before a flush is forced
+app.config['VOTE_COALESCE_MAX_PENDING'] = int(os.environ.get('VOTE_COALESCE_MAX_PENDING', 10000))
+# votes must carry a username (one vote per user per post), VOTE_REQUIRE_USERNAME=0 also accepts anonymous votes
+app.config['VOTE_REQUIRE_USERNAME'] = os.environ.get('VOTE_REQUIRE_USERNAME', '1') == '1'
+
+# request latency per route on /metrics
+metrics.init_app(app, 'vote_api')
+
+# fields stored in every vote hash
+VOTE_FIELDS = ('score', 'published', 'community_name')
+# post fields kept next to the vote fields so feeds can be served without post_api (synced by post_api)
+SUMMARY_FIELDS = ('title', 'url', 'username', 'description')
+
+# every key a Lua script below touches is passed in KEYS, and all the keys of a call live on the shard of the post
+# (each shard holds its own global indexes), so the scripts run on standalone redis servers; the global indexes
+# of a shard hash to different slots, Redis Cluster would reject the calls (CROSSSLOT), the votes are scaled out
+# by client-side sharding over VOTE_REDIS_URLS instead
+
+# Lua script applying a vote atomically in one round trip
+# KEYS[1]: vote hash of the post, KEYS[2]: global score index, KEYS[3]: global hot index,
+# KEYS[4]: voters hash of the post (hashed username -> 1 or -1),
+# KEYS[5], KEYS[6]: score and hot indexes of the community of the post (unused if it has none)
+# ARGV[1]: vote (1 or -1, or the sum of coalesced anonymous votes), ARGV[2]: uuid,
+# ARGV[3]: community of the post as known by the caller ('' for none)
+# ARGV[4], ARGV[5]: epoch and decay of the hot ranking (same formula as ranking.hot)
+# ARGV[6]: hashed username of the voter, '' for an anonymous vote
+# a user voting again in the same direction changes nothing, a changed vote moves the score by the difference
+# returns nil if the post has no vote hash, {community_name} without voting if the hash holds another community
+# than ARGV[3], else {score, published, community_name, amount added to the score}
+VOTE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'score') == 0 then
+    return nil
+end
+local community_name = redis.call('HGET', KEYS[1], 'community_name') or ''
+if community_name ~= ARGV[3] then
+    return {community_name}
+end
+local amount = tonumber(ARGV[1])
+if ARGV[6] ~= '' then
+    local previous = tonumber(redis.call('HGET', KEYS[4], ARGV[6]) or 0)
+    if previous == amount then
+        local current = redis.call('HMGET', KEYS[1], 'score', 'published')
+        return {current[1], current[2], community_name, '0'}
+    end
+    redis.call('HSET', KEYS[4], ARGV[6], ARGV[1])
+    amount = amount - previous
+end
+local score = redis.call('HINCRBY', KEYS[1], 'score', amount)
+local published = redis.call('HGET', KEYS[1], 'published')
+local order = math.log10(math.max(math.abs(score), 1))
+local sign = 0
+if score > 0 then sign = 1 elseif score < 0 then sign = -1 end
+local hot = sign * order + (tonumber(published) - ARGV[4]) / ARGV[5]
+hot = math.floor(hot * 1e7 + 0.5) / 1e7
+redis.call('ZADD', KEYS[2], score, ARGV[2])
+redis.call('ZADD', KEYS[3], hot, ARGV[2])
+if community_name ~= '' then
+    redis.call('ZADD', KEYS[5], score, ARGV[2])
+    redis.call('ZADD', KEYS[6], hot, ARGV[2])
+end
+return {tostring(score), published, community_name, tostring(amount)}
+"""
+
+# Lua script deleting a post and every index entry of it atomically
+# KEYS[1]: vote hash of the post, KEYS[2], KEYS[3], KEYS[4]: global score, published and hot indexes,
+# KEYS[5]: voters hash of the post, KEYS[6], KEYS[7], KEYS[8]: score, published and hot indexes of the community
+# of the post, KEYS[9]: community set (named after the community), unused if the post has no community
+# ARGV[1]: uuid, ARGV[2]: community of the post as known by the caller ('' for none)
+# returns -1 without deleting anything if the hash holds another community than ARGV[2],
+# else the number of keys and index entries removed
+DELETE_SCRIPT = """
+local community_name = redis.call('HGET', KEYS[1], 'community_name')
+if community_name and community_name ~= ARGV[2] then
+    return -1
+end
+local removed = redis.call('DEL', KEYS[1], KEYS[5])
+for i = 2, 4 do
+    removed = removed + redis.call('ZREM', KEYS[i], ARGV[1])
+end
+if ARGV[2] ~= '' then
+    for i = 6, 8 do
+        removed = removed + redis.call('ZREM', KEYS[i], ARGV[1])
+    end
+    removed = removed + redis.call('SREM', KEYS[9], ARGV[1])
+end
+return removed
+"""
+
+# Lua script removing the orphans among candidate uuids found by the sweeper
+# a uuid is an orphan when its vote hash has no score, this is checked again here so a post
+# voted on or created between the scan and the removal is kept
+# KEYS[1]: index holding the uuids (unused in voters mode), KEYS[2..n+1]: vote hashes of the n candidates,
+# KEYS[n+2..2n+1]: voters hashes of the candidates (voters mode only)
+# ARGV[1]: 'zset' or 'set' (remove the uuids from KEYS[1]) or 'voters' (delete the voters hashes of the uuids)
+# ARGV[2..n+1]: candidate uuids
+# returns the number of entries removed
+SWEEP_SCRIPT = """
+local n = #ARGV - 1
+local removed = 0
+for i = 1, n do
+    if redis.call('HEXISTS', KEYS[i + 1], 'score') == 0 then
+        if ARGV[1] == 'zset' then
+            removed = removed + redis.call('ZREM', KEYS[1], ARGV[i + 1])
+        elseif ARGV[1] == 'set' then
+            removed = removed + redis.call('SREM', KEYS[1], ARGV[i + 1])
+        else
+            removed = removed + redis.call('DEL', KEYS[n + i + 1])
+        end
+    end
+end
+return removed
+"""
+
+# thread pool of scatter(), created by use_shards()
+shard_pool = None
+
+
+# Init the Redis databases, one client per shard of VOTE_REDIS_URLS
+def init_db(urls=None):
+    urls = urls or app.config['VOTE_REDIS_URLS']
+    return [redis.StrictRedis.from_url(url.strip(), decode_responses=True) for url in urls if url.strip()]
+
+
+# use these redis clients as the shards, the shard of a uuid depends on their number and order
+def use_shards(clients):
+    global shards, shard_pool
+    shards = list(clients)
+    # the threads of the previous shards finish their calls and exit
+    if shard_pool is not None:
+        shard_pool.shutdown(wait=False)
+    # the shards are queried in parallel by scatter()
+    shard_pool = ThreadPoolExecutor(max_workers=4 * len(shards), thread_name_prefix='vote-shard')
+
+
+# index of the shard holding a post: its vote hash, voters and index entries all live on that shard,
+# so every lua script only touches keys of one redis server
+def shard_index(uuid):
+    digest = hashlib.blake2b(str(uuid).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % len(shards)
+
+
+# redis client of the shard holding a post
+def shard(uuid):
+    return shards[shard_index(uuid)]
+
+
+# uuids grouped by the index of their shard, in their order
+def group_by_shard(uuids):
+    groups = {}
+    for uuid in uuids:
+        groups.setdefault(shard_index(uuid), []).append(uuid)
+    return groups
+
+
+# helper function calling fn on every item (usually a shard) in parallel, results in the order of items
+def scatter(fn, items):
+    items = list(items)
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    return list(shard_pool.map(fn, items))
+
+
+# sorted set ranking the posts of a community (or of every community) by score
+def score_key(community_name=None):
+    if community_name is None:
+        return "score"
+    return "score:{}".format(community_name)
+
+
+# sorted set ranking the posts of a community (or of every community) by published time
+def published_key(community_name=None):
+    if community_name is None:
+        return "published"
+    return "published:{}".format(community_name)
+
+
+# sorted set ranking the posts of a community (or of every community) by hot score
+def hot_key(community_name=None):
+    if community_name is None:
+        return "hot"
+    return "hot:{}".format(community_name)
+
+
+# queue every write of a new vote row (hash, community set and indexes) on a pipeline
+def add_vote(pipe, uuid, community_name, score, published):
+    hot_score = hot(float(score), float(published))
+    pipe.hset(uuid, mapping={"community_name": community_name, "score": score, "published": published})
+    pipe.sadd(community_name, uuid)
+    pipe.zadd(score_key(), {uuid: score})
+    pipe.zadd(published_key(), {uuid: published})
+    pipe.zadd(hot_key(), {uuid: hot_score})
+    pipe.zadd(score_key(community_name), {uuid: score})
+    pipe.zadd(published_key(community_name), {uuid: published})
+    pipe.zadd(hot_key(community_name), {uuid: hot_score})
 
-# Init the Redis database
-def init_db():
-    db = redis.StrictRedis(host='localhost',
-    port=6379,
-    db=1,
-    decode_responses=True)
-    return db
 
-def fill_db():
-    r.flushdb()
-    with open('data/votes.json') as data_file:
-        test_data = json.load(data_file)
+# feed summary of a post (fields of SUMMARY_FIELDS with a value)
+def post_summary(post):
+    return {i: post[i] for i in SUMMARY_FIELDS if post.get(i) not in (None, "")}
 
-    length = (len(test_data["data"]))
-    for i in range(0,length):
-        d = test_data["data"][i]
-        uuid = d["uuid"]
-        published = d["published"]
-        score = d["score"]
-        community_name = d["community_name"]
 
-        #--adding in redis
-        r.hset(uuid, "community_name" ,community_name)
-        r.sadd(community_name,  uuid)
-        r.hset(uuid, "score" ,score)
-        r.hset(uuid, "published" ,published)
-        r.zadd("score",{uuid : score })
-        r.zadd("published",{ uuid: published })
+# version of the votes and posts data files and number of shards, "<sha1>:<shards>",
+# stored in LOADED_KEY on every shard once the files are loaded
+def data_version():
+    sha = hashlib.sha1()
+    for path in (DATABASE_DATA, POSTS_DATA):
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+    return "{}:{}".format(sha.hexdigest(), len(shards))
 
 
-# initiaize redis database
-r = init_db()
+# bulk load DATABASE_DATA in pipelined batches of batch_size records, every shard gets its posts
+# in one pipeline per batch, the shards are written in parallel
+# loading is skipped when LOADED_KEY already holds the version of the data file on every shard
+# force flushes the shards (live votes included) and loads the file again, it is required after
+# changing the number of shards as the posts then move to other shards
+def load_votes(batch_size=1000, force=False):
+    version = data_version()
+    if force:
+        scatter(lambda db: db.flushdb(), shards)
+        post_communities.clear()
+    else:
+        loaded = [db.get(LOADED_KEY) for db in shards]
+        if all(v == version for v in loaded):
+            print(f"Votes data version {version} already loaded, skipping")
+            return 0
+        # before sharding the version had no shard count, it was loaded on one shard
+        if any(v is not None and (v.partition(':')[2] or '1') != str(len(shards)) for v in loaded):
+            print("Votes were loaded with another number of shards, load them again with --force")
+            return 0
+
+    with open(DATABASE_DATA) as data_file:
+        data = json.load(data_file)["data"]
+
+    count = 0
+    for start in range(0, len(data), batch_size):
+        batch = data[start:start + batch_size]
+        pipes = [db.pipeline(transaction=False) for db in shards]
+        for d in batch:
+            add_vote(pipes[shard_index(d["uuid"])], d["uuid"], d["community_name"], d["score"], d["published"])
+        scatter(lambda pipe: pipe.execute(), pipes)
+        count += len(batch)
+        print(f"{count}/{len(data)} items written to db")
+
+    with open(POSTS_DATA) as data_file:
+        posts = json.load(data_file)["data"]
+    for start in range(0, len(posts), batch_size):
+        pipes = [db.pipeline(transaction=False) for db in shards]
+        for post in posts[start:start + batch_size]:
+            summary = post_summary(post)
+            if summary:
+                pipes[shard_index(post["uuid"])].hset(post["uuid"], mapping=summary)
+        scatter(lambda pipe: pipe.execute(), pipes)
+    print(f"{len(posts)} post summaries written to db")
+    for db in shards:
+        db.set(LOADED_KEY, version)
+    return count
+
+
+# initiaize the redis databases
+use_shards([metrics.instrument_redis(db) for db in init_db()])
+
+# register the lua scripts, they are called with EVALSHA on the shard of the post (client=...),
+# and loaded again on NOSCRIPT
+vote_script = shards[0].register_script(VOTE_SCRIPT)
+delete_script = shards[0].register_script(DELETE_SCRIPT)
+sweep_script = shards[0].register_script(SWEEP_SCRIPT)
+
+
+# $FLASK_APP=vote_api.py flask init
+# use flask init to load the votes data file into redis (skipped if already loaded)
+# flask init --force flushes the database and loads it again
+@app.cli.command('init')
+@click.option('--force', is_flag=True, help='Flush the database and load the data file again')
+@click.option('--batch-size', default=1000, show_default=True, help='Records written per pipelined round trip')
+def init_votes(force, batch_size):
+    print('*' * 30)
+    start = time.perf_counter()
+    count = load_votes(batch_size=batch_size, force=force)
+    print(f"{count} votes loaded in {time.perf_counter() - start:.1f}s")
+    print('*' * 30)
 
-# load data in redis database
-fill_db()
+
+# $FLASK_APP=vote_api.py flask sweep
+# removes the index entries left by deleted posts, --check-posts also deletes the votes of posts
+# deleted from post_api (which must be running) once they have been missing for --grace seconds,
+# --interval repeats the sweep every interval seconds
+@app.cli.command('sweep')
+@click.option('--batch-size', default=500, show_default=True, help='Entries checked per round trip')
+@click.option('--check-posts', is_flag=True, help='Delete the votes of posts that post_api no longer has')
+@click.option('--grace', default=600, show_default=True,
+              help='Seconds a post must stay missing from post_api (seen on two sweeps) before its votes are deleted')
+@click.option('--interval', default=0, show_default=True, help='Seconds between sweeps, 0 sweeps once')
+def sweep(batch_size, check_posts, grace, interval):
+    while True:
+        start = time.perf_counter()
+        reclaimed = sweep_indexes(batch_size)
+        if check_posts:
+            try:
+                reclaimed['deleted_posts'] = sweep_deleted_posts(min(batch_size, 100), grace)
+            except RuntimeError as e:
+                # nothing more is deleted in this sweep, the next one checks again
+                print(f"deleted posts not swept: {e}")
+        summary = ', '.join(f"{count} {kind}" for kind, count in reclaimed.items())
+        print(f"reclaimed {summary} in {time.perf_counter() - start:.1f}s")
+        if not interval:
+            return
+        time.sleep(interval)
 
 
 # helper function to generate a response with status code and message
@@ -78,6 +404,382 @@ def get_response(status_code, message):
     return {"status_code": str(status_code), "message": str(message)}
 
 
+# helper function to fetch the vote rows of many uuids at once
+# one HMGET per uuid is queued on a pipeline of its shard and sent every batch_size uuids,
+# so n uuids cost ceil(n / batch_size) round trips per shard instead of 3 * n, the shards are read in parallel
+# uuids without a vote hash are skipped, the order of uuids is preserved
+# summary=True adds the post summary fields stored for the uuid (title, url, username, description)
+def get_votes(uuids, batch_size=None, summary=False):
+    batch_size = batch_size or app.config['REDIS_BATCH_SIZE']
+    fields = VOTE_FIELDS + SUMMARY_FIELDS if summary else VOTE_FIELDS
+    uuids = list(uuids)
+
+    def read(group):
+        index, group_uuids = group
+        rows = {}
+        for start in range(0, len(group_uuids), batch_size):
+            chunk = group_uuids[start:start + batch_size]
+            pipe = shards[index].pipeline(transaction=False)
+            for uuid in chunk:
+                pipe.hmget(uuid, *fields)
+            for uuid, values in zip(chunk, pipe.execute()):
+                score, published, community_name = values[:3]
+                if score is not None:
+                    row = {'uuid': uuid, 'score': score, 'published': published, 'community_name': community_name}
+                    for field, value in zip(fields[3:], values[3:]):
+                        if value is not None:
+                            row[field] = value
+                    rows[uuid] = row
+        return rows
+
+    found = {}
+    for rows in scatter(read, group_by_shard(uuids).items()):
+        found.update(rows)
+    return [found[uuid] for uuid in uuids if uuid in found]
+
+
+# helper function to fetch the scores of many uuids from the score index of their shard
+# ZMSCORE is sent on a pipeline every batch_size uuids, uuids missing from the index get None
+def get_scores(uuids, batch_size=None):
+    batch_size = batch_size or app.config['REDIS_BATCH_SIZE']
+    uuids = list(uuids)
+
+    def read(group):
+        index, group_uuids = group
+        pipe = shards[index].pipeline(transaction=False)
+        for start in range(0, len(group_uuids), batch_size):
+            pipe.zmscore(score_key(), group_uuids[start:start + batch_size])
+        scores = []
+        for chunk in pipe.execute():
+            scores += chunk
+        return dict(zip(group_uuids, scores))
+
+    found = {}
+    for scores in scatter(read, group_by_shard(uuids).items()):
+        found.update(scores)
+    return [found[uuid] for uuid in uuids]
+
+
+# hash of the voters of a post, hashed username -> vote (1 or -1)
+def voters_key(uuid):
+    return "voters:{}".format(uuid)
+
+
+# 64 bit hash of a username, the voters hashes hold 16 characters per voter whatever the username length
+def user_hash(username):
+    return hashlib.blake2b(str(username).encode(), digest_size=8).hexdigest()
+
+
+# community of the posts by uuid ('' for a post without one), a post keeps its community so it is read once
+# per process and passed to the scripts, which report a mismatch (a uuid deleted and created again elsewhere)
+post_communities = {}
+# the cache is emptied when it would grow over this many uuids
+POST_COMMUNITIES_MAX = 100000
+
+
+# helper function to get the community of many uuids, {uuid: community_name, '' for none, None without vote hash}
+# the uuids not cached yet are read in one pipelined round trip per shard
+def get_communities(uuids):
+    uuids = list(uuids)
+    missing = [uuid for uuid in uuids if uuid not in post_communities]
+    if missing:
+        def read(group):
+            index, group_uuids = group
+            pipe = shards[index].pipeline(transaction=False)
+            for uuid in group_uuids:
+                pipe.hmget(uuid, 'score', 'community_name')
+            return {uuid: community_name or '' for uuid, (score, community_name) in zip(group_uuids, pipe.execute())
+                    if score is not None}
+        if len(post_communities) + len(missing) > POST_COMMUNITIES_MAX:
+            post_communities.clear()
+        for found in scatter(read, group_by_shard(missing).items()):
+            post_communities.update(found)
+    return {uuid: post_communities.get(uuid) for uuid in uuids}
+
+
+# keys and arguments of a vote script call
+def vote_script_call(uuid, amount, community_name, username=None):
+    keys = [uuid, score_key(), hot_key(), voters_key(uuid), score_key(community_name), hot_key(community_name)]
+    args = [amount, uuid, community_name, HOT_EPOCH, HOT_DECAY,
+            user_hash(username) if username is not None else '']
+    return keys, args
+
+
+# helper function to record the outcome of a vote script call in post_communities
+# returns True if the vote was applied or the post has no vote hash, False to call the script again
+def vote_script_done(uuid, result):
+    if result is None:
+        post_communities.pop(uuid, None)
+        return True
+    if len(result) == 1:
+        post_communities[uuid] = result[0]
+        return False
+    return True
+
+
+# helper function to upvote (amount=1) or downvote (amount=-1) a post
+# the hash, the voters of the post, the global and the community score and hot indexes are updated by one script call
+# a username votes at most once per post, voting the other way changes the vote
+# with coalescing on, anonymous votes are queued and written by the next flush
+# returns the updated vote row (None if the uuid has no vote hash) and the amount added to the score
+# (0 when the user had already voted the same way)
+def apply_vote(uuid, amount, username=None):
+    if vote_coalescer is not None and username is None:
+        row = vote_coalescer.add(uuid, amount)
+        return row, amount if row is not None else 0
+    while True:
+        community_name = get_communities([uuid])[uuid]
+        if community_name is None:
+            return None, 0
+        keys, args = vote_script_call(uuid, amount, community_name, username)
+        result = vote_script(keys=keys, args=args, client=shard(uuid))
+        if vote_script_done(uuid, result):
+            break
+    if result is None:
+        return None, 0
+    score, published, community_name, applied = result
+    return {'uuid': uuid, 'score': score, 'published': published, 'community_name': community_name or None}, \
+        int(applied)
+
+
+# helper function to read the stored vote row of a uuid, None if it has no vote hash
+def get_vote_row(uuid):
+    score, published, community_name = shard(uuid).hmget(uuid, *VOTE_FIELDS)
+    if score is None:
+        return None
+    return {'uuid': uuid, 'score': score, 'published': published, 'community_name': community_name}
+
+
+# helper function to apply the summed votes of many uuids ({uuid: amount}) in one pipelined round trip per shard
+# the votes of posts whose community was not the cached one are sent again
+def flush_votes(deltas):
+    while deltas:
+        communities = get_communities(deltas)
+        pipes = [db.pipeline(transaction=False) for db in shards]
+        for uuid, amount in deltas.items():
+            if communities[uuid] is not None:
+                keys, args = vote_script_call(uuid, amount, communities[uuid])
+                vote_script(keys=keys, args=args, client=pipes[shard_index(uuid)])
+        groups = group_by_shard(uuid for uuid in deltas if communities[uuid] is not None)
+        results = scatter(lambda index: pipes[index].execute(), groups)
+        deltas = {uuid: deltas[uuid] for index, group_results in zip(groups, results)
+                  for uuid, result in zip(groups[index], group_results) if not vote_script_done(uuid, result)}
+
+
+vote_coalescer = None
+# only anonymous votes are coalesced (a named vote needs the voters hash to be checked before it is accepted),
+# with usernames required coalescing would silently do nothing
+if app.config['VOTE_COALESCE'] and app.config['VOTE_REQUIRE_USERNAME']:
+    raise RuntimeError("VOTE_COALESCE=1 only coalesces anonymous votes, it requires VOTE_REQUIRE_USERNAME=0")
+if app.config['VOTE_COALESCE']:
+    vote_coalescer = VoteCoalescer(get_vote_row, flush_votes,
+                                   window=app.config['VOTE_COALESCE_WINDOW_MS'] / 1000,
+                                   max_pending=app.config['VOTE_COALESCE_MAX_PENDING'])
+    # votes still waiting are written when the worker exits
+    atexit.register(vote_coalescer.close)
+
+
+# helper function to read the cursor of an index page, "<bound>:<skip>"
+# raises ValueError if it is not a cursor returned in X-Next-Cursor
+def parse_cursor(cursor):
+    bound, _, skip = cursor.rpartition(':')
+    bound, skip = float(bound), int(skip)
+    # nan and inf are not scores redis can range on
+    if skip < 0 or not math.isfinite(bound):
+        raise ValueError('invalid cursor')
+    return bound, skip
+
+
+# helper function to read a page of an index, highest scores first
+# without a cursor the page starts offset rows from the top (ZREVRANGE)
+# a cursor continues after a previous page: rows scored at most bound, skipping the first skip of them
+# (rows tied with the bound that were already returned), then offset more rows (ZREVRANGEBYSCORE)
+# both cost O(log N + limit), returns the uuids and the cursor of the next page (None after the last page)
+# with several shards every shard sends its first rows up to the end of the page and they are merged
+def index_page(index, limit, offset=0, cursor=None):
+    if limit <= 0:
+        return [], None
+    if len(shards) > 1:
+        return merged_index_page(index, limit, offset, cursor)
+    db = shards[0]
+    if cursor is None:
+        rows = db.zrevrange(index, offset, offset + limit - 1, withscores=True)
+    else:
+        bound, skip = cursor
+        rows = db.zrevrangebyscore(index, bound, '-inf', start=skip + offset, num=limit, withscores=True)
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1][1]
+        ties = sum(1 for uuid, score in rows if score == last)
+        if cursor is not None and last == bound:
+            # the whole page is tied with the bound, rows before it were already skipped
+            ties += skip + offset
+        elif cursor is None and ties == limit and offset > 0:
+            # rows above the page may share its score, count them from the index
+            ties = offset + limit - db.zcount(index, '({}'.format(last), '+inf')
+        next_cursor = '{}:{}'.format(last, ties)
+    return [uuid for uuid, score in rows], next_cursor
+
+
+# rows of the indexes of every shard merged (k-way) in the order of one sorted set: score, then uuid, descending
+def merge_rows(rows_per_shard):
+    return heapq.merge(*rows_per_shard, key=lambda row: (row[1], row[0]), reverse=True)
+
+
+# helper function to read a page of an index split over the shards, same pages and cursors as one sorted set
+# every shard returns its skip + offset + limit first rows (in parallel), the merge keeps the first ones of all shards
+# offset pages cost O(shards * (offset + limit)), cursor pages O(shards * (ties + limit))
+def merged_index_page(index, limit, offset=0, cursor=None):
+    if cursor is None:
+        skip = 0
+        def read(db):
+            return db.zrevrange(index, 0, offset + limit - 1, withscores=True)
+    else:
+        bound, skip = cursor
+        def read(db):
+            return db.zrevrangebyscore(index, bound, '-inf', start=0, num=skip + offset + limit, withscores=True)
+    head = list(itertools.islice(merge_rows(scatter(read, shards)), skip + offset + limit))
+    rows = head[skip + offset:]
+    next_cursor = None
+    if len(rows) == limit:
+        # every row tied with the last one up to the end of the page is in head
+        last = rows[-1][1]
+        next_cursor = '{}:{}'.format(last, sum(1 for uuid, score in head if score == last))
+    return [uuid for uuid, score in rows], next_cursor
+
+
+# helper function to delete a post from every structure holding it in one atomic script call
+# returns the number of keys and index entries removed (0 if the uuid was unknown)
+def remove_vote(uuid):
+    community_name = get_communities([uuid])[uuid] or ''
+    while True:
+        removed = delete_script(keys=[uuid, score_key(), published_key(), hot_key(), voters_key(uuid),
+                                      score_key(community_name), published_key(community_name),
+                                      hot_key(community_name), community_name],
+                                args=[uuid, community_name], client=shard(uuid))
+        if removed >= 0:
+            break
+        # the hash holds another community than the cached one
+        community_name = shard(uuid).hget(uuid, 'community_name') or ''
+    post_communities.pop(uuid, None)
+    return removed
+
+
+# names of the communities that have per community indexes on a shard
+def community_names(db, batch_size):
+    names = set()
+    for prefix in (score_key(''), published_key(''), hot_key('')):
+        for key in db.scan_iter(match=prefix + '*', count=batch_size, _type='zset'):
+            names.add(key[len(prefix):])
+    return names
+
+
+# helper function to check and clean candidate uuids of a shard with one sweep script call
+def sweep_batch(db, index, kind, uuids):
+    keys = [index] + uuids
+    if kind == 'voters':
+        keys += [voters_key(uuid) for uuid in uuids]
+    return sweep_script(keys=keys, args=[kind] + uuids, client=db)
+
+
+# helper function to remove the uuids of an index (sorted set or set) of a shard that have no vote hash left
+# the index is read incrementally with ZSCAN/SSCAN, each batch is checked and cleaned by one script call
+def sweep_index(db, index, kind, batch_size):
+    removed = 0
+    if kind == 'zset':
+        members = (uuid for uuid, score in db.zscan_iter(index, count=batch_size))
+    else:
+        members = db.sscan_iter(index, count=batch_size)
+    batch = []
+    for uuid in members:
+        batch.append(uuid)
+        if len(batch) >= batch_size:
+            removed += sweep_batch(db, index, kind, batch)
+            batch = []
+    if batch:
+        removed += sweep_batch(db, index, kind, batch)
+    return removed
+
+
+# helper function to remove the index entries and voters hashes of deleted posts, shard by shard
+# returns the number of entries reclaimed per kind of structure
+def sweep_indexes(batch_size=500):
+    reclaimed = {'indexes': 0, 'community_sets': 0, 'voters': 0}
+    for db in shards:
+        for index in (score_key(), published_key(), hot_key()):
+            reclaimed['indexes'] += sweep_index(db, index, 'zset', batch_size)
+        for community_name in community_names(db, batch_size):
+            for index in (score_key(community_name), published_key(community_name), hot_key(community_name)):
+                reclaimed['indexes'] += sweep_index(db, index, 'zset', batch_size)
+            if db.type(community_name) == 'set':
+                reclaimed['community_sets'] += sweep_index(db, community_name, 'set', batch_size)
+        batch = []
+        for key in db.scan_iter(match=voters_key('*'), count=batch_size, _type='hash'):
+            batch.append(key[len(voters_key('')):])
+            if len(batch) >= batch_size:
+                reclaimed['voters'] += sweep_batch(db, score_key(), 'voters', batch)
+                batch = []
+        if batch:
+            reclaimed['voters'] += sweep_batch(db, score_key(), 'voters', batch)
+    return reclaimed
+
+
+# helper function to delete the votes and summaries of posts that no longer exist in post_api
+# post hashes are found with SCAN on every shard and checked against post_api /get_uuids batch by batch,
+# with their published time (BatchGetItem) and without going through the post cache of post_api
+# a post missing for the first time is only marked in SWEEP_MISSING_KEY, it is deleted by a later sweep
+# that finds it still missing grace seconds after the mark, a post found again loses its mark
+# raises RuntimeError (before deleting anything of the batch) if post_api fails or reports every post
+# of a batch missing, as when its table is being reloaded or is empty
+# returns the number of posts removed
+def sweep_deleted_posts(batch_size=100, grace=600):
+    removed = 0
+    now = time.time()
+    for db in shards:
+        uuids = (key for key in db.scan_iter(count=batch_size, _type='hash') if ':' not in key)
+        while True:
+            batch = [uuid for _, uuid in zip(range(batch_size), uuids)]
+            if not batch:
+                break
+            pipe = db.pipeline(transaction=False)
+            for uuid in batch:
+                pipe.hget(uuid, 'published')
+            pipe.hmget(SWEEP_MISSING_KEY, batch)
+            *published, marks = pipe.execute()
+            keys = [{'uuid': uuid, 'published': p} if p is not None else uuid for uuid, p in zip(batch, published)]
+            response = post_backend.post('/get_uuids', json={'uuid': keys, 'report_missing': True, 'cache': False})
+            if response.status_code != 200:
+                raise RuntimeError(f"post_api /get_uuids returned {response.status_code}")
+            missing = set(response.json()['missing'])
+            if len(batch) >= SWEEP_ABORT_MIN_BATCH and len(missing) == len(batch):
+                raise RuntimeError(f"post_api reported all {len(batch)} posts of a batch missing")
+            expired = []
+            pipe = db.pipeline(transaction=False)
+            for uuid, mark in zip(batch, marks):
+                if uuid not in missing:
+                    if mark is not None:
+                        pipe.hdel(SWEEP_MISSING_KEY, uuid)
+                elif mark is None:
+                    pipe.hset(SWEEP_MISSING_KEY, uuid, now)
+                elif now - float(mark) >= grace:
+                    expired.append(uuid)
+                    pipe.hdel(SWEEP_MISSING_KEY, uuid)
+            pipe.execute()
+            for uuid in expired:
+                if remove_vote(uuid) > 0:
+                    removed += 1
+        # marks of posts deleted since they were marked
+        marked = [uuid for uuid, mark in db.hscan_iter(SWEEP_MISSING_KEY, count=batch_size)]
+        if marked:
+            pipe = db.pipeline(transaction=False)
+            for uuid in marked:
+                pipe.exists(uuid)
+            gone = [uuid for uuid, exists in zip(marked, pipe.execute()) if not exists]
+            if gone:
+                db.hdel(SWEEP_MISSING_KEY, *gone)
+    return removed
+
+
 # home page
 @app.route('/', methods=['GET'])
 def home():
@@ -94,20 +796,9 @@ def page_not_found(status_code=404):
 # It will return all the rows from the database
 @app.route('/get_all', methods=['GET'])
 def get_votes_all():
-    all_id_sorted_by_score = r.zrange("score", 0, -1, desc=True)
-    json_ = []
-
-    for uuid in all_id_sorted_by_score:
-        d={}
-        score = r.hget(uuid,"score")
-        published = r.hget(uuid,"published")
-        community_name = r.hget(uuid,"community_name")
-        d["uuid"]=uuid
-        d["score"] = score
-        d["published"] = published
-        d["community_name"] = community_name
-        json_.append(d)
-
+    rows = merge_rows(scatter(lambda db: db.zrange(score_key(), 0, -1, desc=True, withscores=True), shards))
+    all_id_sorted_by_score = [uuid for uuid, score in rows]
+    json_ = get_votes(all_id_sorted_by_score)
     return jsonify(json_), 200
 
 
@@ -118,22 +809,19 @@ def get_score_list():
     if params.get('uuid') is None:
         return jsonify(get_response(status_code=404, message='uuid attribute not found'))
     uuids = params.get('uuid')
-    json_ = []
-    for i in uuids:
-        score = r.hget(i,"score")
-        community_name = r.hget(i,"community_name")
-        published = r.hget(i,"published")
-        if score is not None:
-            json_.append({'uuid': i, 'community_name':community_name, 'score': score, 'published':published})
-    if len(json_) > 0:
-        if bool(params.get('sorted')):
-            json_ = sorted(json_, key=lambda x: int(x['score']), reverse=True)
-
-        if params.get('n') is not None:
-            json_ = json_[:int(params.get('n'))]
-        return jsonify(json_), 200
-    else:
-        return jsonify([]), 200
+    n = params.get('n')
+    # scores of every uuid in one batched call, then only the selected rows are hydrated
+    scored = [(uuid, score) for uuid, score in zip(uuids, get_scores(uuids)) if score is not None]
+    if bool(params.get('sorted')):
+        if n is not None:
+            # bounded heap of size n instead of sorting every uuid
+            scored = heapq.nlargest(int(n), scored, key=lambda x: x[1])
+        else:
+            scored = sorted(scored, key=lambda x: x[1], reverse=True)
+    elif n is not None:
+        scored = scored[:int(n)]
+    json_ = get_votes([uuid for uuid, score in scored])
+    return jsonify(json_), 200
 
 
 """
@@ -142,58 +830,120 @@ http://127.0.0.1:5000/get?n=25&community_name=csuf
 http://127.0.0.1:5000/get?n=25
 http://127.0.0.1:5000/get?n=25&sorted=True
 http://127.0.0.1:5000/get?uuid=CUJCJWC6NZGR1A781OSPMNKPJ
+http://127.0.0.1:5000/get?uuid=CUJCJWC6NZGR1A781OSPMNKPJ&username=some_guy_or_gal
+
+http://127.0.0.1:5000/get?n=25&sorted=True&summary=True
+http://127.0.0.1:5000/get?limit=25&offset=50&sorted=True
+http://127.0.0.1:5000/get?n=25&sorted=True&cursor=<X-Next-Cursor of the previous page>
 
 It will return the rows as per parameters passed
+summary=True adds the post summary (title, url, username, description) to every row
+with uuid, username adds the vote of that user (user_vote: 1, -1 or 0)
+limit is the same as n, offset skips rows from the top of the ranking
+when the page is full, X-Next-Cursor holds the cursor of the next page (on the score when sorted,
+on the published time otherwise), deep pages cost the same as the first one
 """
 @app.route('/get', methods=['GET'])
 def get_score():
     params = request.args
     if params.get('uuid') is not None:
-        score = r.hget(params.get('uuid'),"score")
-        published = r.hget(params.get('uuid'),"published")
-        community_name = r.hget(params.get('uuid'),"community_name")
-        if score is not None:
-            json_ = [
-                {
-                    'uuid': params.get('uuid'),
-                    'score': score ,
-                    'published': published,
-                    'community_name': community_name
-                }
-            ]
+        json_ = get_votes([params.get('uuid')])
+        if len(json_) > 0:
+            if params.get('username') is not None:
+                # vote of the user on this post: 1, -1 or 0 if they did not vote
+                voters = shard(params['uuid']).hget(voters_key(params['uuid']), user_hash(params['username']))
+                json_[0]['user_vote'] = int(voters or 0)
             return jsonify(json_), 200
         else:
             return jsonify(get_response(404, "score not found"))
-    elif params.get('n') is not None:
+    elif params.get('n') is not None or params.get('limit') is not None:
+        # top n of the score index when sorted, else the n most recent posts
+        # community_name selects the per community indexes
+        community_name = params.get('community_name')
+        if bool(params.get('sorted')):
+            index = score_key(community_name)
+        else:
+            index = published_key(community_name)
+        return index_page_response(index, params)
 
-        if params.get('community_name') is not None:
 
-            community_id_set = r.smembers( params.get('community_name') )
-            json_=[]
-            for uuid in community_id_set:
-                score = r.hget(uuid,"score")
-                published = r.hget(uuid,"published")
-                community_name = r.hget(uuid,"community_name")
+# helper function to answer a page of an index with the limit/n, offset, cursor and summary params
+def index_page_response(index, params):
+    try:
+        limit = int(params.get('limit', params.get('n')))
+        offset = int(params.get('offset', 0))
+        cursor = parse_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError:
+        return jsonify(get_response(status_code=400, message='invalid limit, offset or cursor')), 400
+    if offset < 0:
+        return jsonify(get_response(status_code=400, message='invalid limit, offset or cursor')), 400
+    keys, next_cursor = index_page(index, limit, offset, cursor)
+    json_ = get_votes(keys, summary=bool(params.get('summary')))
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return jsonify(json_), 200, headers
 
-                if score is not None:
-                    json_.append({'uuid': uuid, 'score':score , 'published': published , 'community_name':community_name })
 
-            if bool(params.get('sorted')):
-                json_ = sorted(json_, key=lambda x: int(x['score']), reverse=True)
-            return jsonify(json_[:int(params.get('n'))])
+"""
+http://127.0.0.1:5000/hot?n=25
+http://127.0.0.1:5000/hot?n=25&community_name=csuf
+http://127.0.0.1:5000/hot?n=25&summary=True
+http://127.0.0.1:5000/hot?n=25&cursor=<X-Next-Cursor of the previous page>
 
-        keys = r.zrange("published", 0, -1, desc=True)
-        json_ = []
-        for uuid in keys:
+It will return the n hottest rows (Reddit's hot ranking), ranked by the hot index
+offset, limit and cursor page the ranking like /get
+"""
+@app.route('/hot', methods=['GET'])
+def get_hot():
+    params = request.args
+    if params.get('n') is None and params.get('limit') is None:
+        return jsonify(get_response(status_code=404, message='n attribute not found'))
+    return index_page_response(hot_key(params.get('community_name')), params)
 
-            score = r.hget(uuid,"score")
-            published = r.hget(uuid,"published")
-            community_name = r.hget(uuid,"community_name")
-            if score is not None:
-                json_.append({'uuid': uuid, 'score':score , 'published': published , 'community_name':community_name })
-        if bool(params.get('sorted')):
-            json_ = sorted(json_, key=lambda x: int(x['score']), reverse=True)
-        return jsonify(json_[:int(params.get('n'))])
+
+# indexes a post can be ranked by with /rank
+RANK_INDEXES = {'score': score_key, 'hot': hot_key, 'published': published_key}
+
+
+"""
+http://127.0.0.1:5000/rank?uuid=CUJCJWC6NZGR1A781OSPMNKPJ
+http://127.0.0.1:5000/rank?uuid=CUJCJWC6NZGR1A781OSPMNKPJ&community_name=csuf&by=hot
+
+It will return the position of a post in a ranking (by score (default), hot or published),
+of every community or of community_name. rank 0 is the top post, it can be passed as offset to /get
+With several shards the rows ranked above the post on the other shards are added to its rank on its own shard
+"""
+@app.route('/rank', methods=['GET'])
+def get_rank():
+    params = request.args
+    uuid = params.get('uuid')
+    if uuid is None:
+        return jsonify(get_response(status_code=404, message='uuid attribute not found'))
+    by = params.get('by', 'score')
+    if by not in RANK_INDEXES:
+        return jsonify(get_response(status_code=400, message='by must be one of score, hot, published')), 400
+    index = RANK_INDEXES[by](params.get('community_name'))
+    home = shard(uuid)
+    pipe = home.pipeline(transaction=False)
+    pipe.zrevrank(index, uuid)
+    pipe.zscore(index, uuid)
+    pipe.zcard(index)
+    rank, score, total = pipe.execute()
+    if rank is None:
+        return jsonify(get_response(status_code=404, message='uuid not found')), 404
+
+    # rows of another shard ranked above the post: a higher score, or the same score and a greater uuid
+    def above(db):
+        pipe = db.pipeline(transaction=False)
+        pipe.zcount(index, '({}'.format(score), '+inf')
+        pipe.zrangebyscore(index, score, score)
+        pipe.zcard(index)
+        higher, tied, size = pipe.execute()
+        return higher + sum(1 for member in tied if member > uuid), size
+
+    for higher, size in scatter(above, [db for db in shards if db is not home]):
+        rank += higher
+        total += size
+    return jsonify(uuid=uuid, by=by, rank=rank, score=score, total=total), 200
 
 
 """
@@ -211,71 +961,74 @@ def create_vote():
         score = params["score"]
         published = params["published"]
 
-        if not r.exists(uuid):
-            r.hset(uuid, "community_name" ,community_name)
-            r.sadd(community_name,  uuid)
-            r.hset(uuid, "score" ,score)
-            r.hset(uuid, "published" ,published)
-            r.zadd("score",{uuid : score })
-            r.zadd("published",{ uuid: published })
+        db = shard(uuid)
+        if not db.hexists(uuid, "score"):
+            pipe = db.pipeline()
+            add_vote(pipe, uuid, community_name, score, published)
+            pipe.execute()
             return jsonify(status_code=201,message="New row created")
 
         return jsonify(status_code=409, message='uuid already exists')
     else:
         return jsonify(get_response(status_code=404, message='uuid attribute not found'))
 
-# It will increment (upvote) the score column into the database
-@app.route('/upvotes',methods=['POST'])
-def get_upvotes():
-    params = request.json
-    uuid=params.get('uuid')
+# helper function casting the vote of a request (amount=1 upvote, amount=-1 downvote)
+def cast_vote(params, amount):
+    uuid = params.get('uuid')
     if uuid is None:
         return jsonify(get_response(status_code=404, message='uuid attribute not found'))
+    username = params.get('username')
+    if username is None and app.config['VOTE_REQUIRE_USERNAME']:
+        return jsonify(get_response(status_code=404, message='username attribute not found'))
+    row, applied = apply_vote(uuid, amount, username)
+    if row is None:
+        return jsonify(get_response(status_code=404, message='uuid not found'))
+    if applied == 0:
+        return jsonify(get_response(status_code=409, message='username already voted')), 409
+    return jsonify([row]), 200
 
-    r.hincrby( uuid ,"score",1)
-    score = r.hget(uuid,"score")
-    published = r.hget(uuid,"published")
-    community_name = r.hget(uuid,"community_name")
-    json_ = [
-        {
-            'uuid': uuid,
-            'score': score ,
-            'published': published,
-            'community_name': community_name
-        }
-    ]
-    return jsonify(json_), 200
+
+# It will increment (upvote) the score column into the database
+@app.route('/upvotes',methods=['POST'])
+def get_upvotes():
+    return cast_vote(request.json, 1)
 
 # It will decrement (downvote) the score column into the database
 @app.route('/downvotes',methods=['POST'])
 def get_downvotes():
+    return cast_vote(request.json, -1)
+
+# It will store the feed summary of a post next to its votes (called by post_api on create and update)
+@app.route('/summary', methods=['POST'])
+def update_summary():
     params = request.json
     if params.get('uuid') is None:
         return jsonify(get_response(status_code=404, message='uuid attribute not found'))
-    uuid = params.get('uuid')
-    r.hincrby( uuid ,"score",-1)
-    score = r.hget(uuid,"score")
-    published = r.hget(uuid,"published")
-    community_name = r.hget(uuid,"community_name")
-    json_ = [
-        {
-            'uuid': params.get('uuid'),
-            'score': score ,
-            'published': published,
-            'community_name': community_name
-        }
-    ]
-    return jsonify(json_), 200
+    summary = post_summary(params)
+    if summary:
+        shard(params['uuid']).hset(params['uuid'], mapping=summary)
+    return jsonify(get_response(status_code=200, message='Summary updated'))
+
 
-# It will delete the entry from the database
+# It will remove the feed summary of a post (called by post_api on delete)
+@app.route('/summary', methods=['DELETE'])
+def delete_summary():
+    params = request.args
+    if params.get('uuid') is None:
+        return jsonify(get_response(status_code=404, message='uuid attribute not found'))
+    shard(params['uuid']).hdel(params['uuid'], *SUMMARY_FIELDS)
+    return jsonify(get_response(status_code=200, message='Summary deleted'))
+
+
+# It will delete the entry from the database, with every index entry and the voters of the post
+# (called by post_api when a post is deleted)
 @app.route('/delete_vote',methods=['DELETE'])
 def delete_vote():
     params = request.args
     if params.get('uuid') is not None:
-        uuid = params["uuid"]
-        if r.exists(uuid):
-            r.delete(uuid)
+        if remove_vote(params["uuid"]) > 0:
             return jsonify(get_response(status_code=200, message='Vote deleted'))
+        return jsonify(get_response(status_code=404, message='uuid not found'))
     else:
         return jsonify(get_response(status_code=404, message='Delete vote requires uuid attribute'))
 
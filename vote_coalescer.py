@@ -0,0 +1,119 @@
+import logging
+import threading
+
+"""
+Write-behind coalescing of votes for vote_api
+
+Votes are summed per uuid in memory and a background thread flushes the sums
+every window seconds as one batch, so a post voted on thousands of times per
+second costs one write per window instead of one per vote. The first vote of a
+uuid in a window reads the stored row (so unknown uuids are still rejected);
+later votes in the same window do not touch Redis.
+
+Staleness is bounded: a vote reaches Redis at most one window (plus the flush
+itself) after it was accepted, or as soon as max_pending uuids are waiting.
+A failed flush keeps its deltas for the next window. close() stops the thread
+and flushes what is left, vote_api registers it to run at exit.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class VoteCoalescer:
+    """sums vote deltas per uuid and flushes them in batches"""
+
+    # load(uuid): stored row of a uuid (dict with score, published, community_name) or None
+    # flush(deltas): writes {uuid: delta} in one batch
+    def __init__(self, load, flush, window=0.05, max_pending=10000):
+        self.load = load
+        self.flush_batch = flush
+        self.window = window
+        self.max_pending = max_pending
+        # uuid -> [pending delta, row read at the start of the window]
+        self.pending = {}
+        self.lock = threading.Lock()
+        # one flush at a time, so batches reach Redis in order
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.votes = 0
+        self.flushes = 0
+
+    @staticmethod
+    def row(uuid, entry):
+        delta, row = entry
+        return {'uuid': uuid, 'score': str(int(row['score']) + delta),
+                'published': row['published'], 'community_name': row['community_name']}
+
+    # add a vote, returns the row of the uuid including the pending votes, or None if the uuid is unknown
+    def add(self, uuid, amount):
+        with self.lock:
+            entry = self.pending.get(uuid)
+            if entry is not None:
+                entry[0] += amount
+                self.votes += 1
+                return self.row(uuid, entry)
+        stored = self.load(uuid)
+        if stored is None:
+            return None
+        with self.lock:
+            entry = self.pending.setdefault(uuid, [0, stored])
+            entry[0] += amount
+            self.votes += 1
+            row = self.row(uuid, entry)
+            full = len(self.pending) >= self.max_pending
+        self.start()
+        if full:
+            try:
+                self.flush()
+            except Exception:
+                # the vote is accepted and stays queued with the others, the next flush writes it
+                logger.exception("forced vote flush failed, retrying in the next window")
+        return row
+
+    # write the pending deltas, returns the number of uuids written
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+            deltas = {uuid: delta for uuid, (delta, row) in batch.items() if delta}
+            if not deltas:
+                return 0
+            try:
+                self.flush_batch(deltas)
+            except Exception:
+                # keep the votes for the next window
+                with self.lock:
+                    for uuid, (delta, row) in batch.items():
+                        entry = self.pending.setdefault(uuid, [0, row])
+                        entry[0] += delta
+                raise
+            with self.lock:
+                self.flushes += 1
+            return len(deltas)
+
+    def run(self):
+        while not self.stopped.wait(self.window):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("vote flush failed, retrying in the next window")
+
+    # start the flush thread (done by the first vote, so forked workers each get their own)
+    def start(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None and not self.stopped.is_set():
+                    self.thread = threading.Thread(target=self.run, name='vote-coalescer', daemon=True)
+                    self.thread.start()
+
+    # stop the flush thread and write the remaining votes
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            return {'pending': len(self.pending), 'votes': self.votes, 'flushes': self.flushes}